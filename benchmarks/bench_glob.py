@@ -0,0 +1,103 @@
+'''
+
+    Compare the ``glob`` argument type with ``glob.glob``.
+
+    Builds a tree of ``--files`` files (1M by default) in a temporary
+    directory, or reuses ``--root``, then times expanding ``**/*.txt``:
+
+    * ``glob.glob``, which returns the full list
+    * the ``glob`` type, to the first path and to the last one
+    * the ``glob`` type given two overlapping patterns, deduplicated
+
+    Run from the repository root:
+
+    ::
+
+        python benchmarks/bench_glob.py --files 100000
+
+'''
+
+from __future__ import print_function
+
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    os.pardir))
+
+from blargs import Parser
+
+
+def build(root, files, per_directory):
+    ''' Create ``files`` empty files under ``root``, ``per_directory`` in
+    each leaf directory, two levels deep. '''
+
+    count = 0
+    directory = 0
+    while count < files:
+        leaf = os.path.join(root, 'd%03d' % (directory // 100),
+                'd%05d' % directory)
+        os.makedirs(leaf)
+        for i in range(min(per_directory, files - count)):
+            open(os.path.join(leaf, 'f%d.txt' % i), 'w').close()
+            count += 1
+        directory += 1
+
+
+def timed(label, func):
+    start = time.time()
+    result = func()
+    print('%-40s %8.3fs' % (label, time.time() - start))
+    return result
+
+
+def main():
+    p = Parser()
+    p.int('files').default(1000000).described_as('Number of files.')
+    p.int('per-directory').default(1000).described_as(
+            'Files per leaf directory.')
+    p.directory('root').described_as(
+            'Existing tree to use instead of building one.')
+    args = p.process_command_line()
+
+    root = args['root']
+    tree = root
+    if tree is None:
+        tree = tempfile.mkdtemp()
+        timed('build %d files' % args['files'], lambda: build(tree,
+            args['files'], args['per-directory']))
+
+    pattern = os.path.join(tree, '**', '*.txt')
+    overlapping = os.path.join(tree, 'd000', '**', '*.txt')
+
+    def parse(*patterns):
+        p = Parser({})
+        p.glob('inputs').multiple()
+        args = []
+        for item in patterns:
+            args += ['--inputs', item]
+        return p._process_command_line(args)['inputs']
+
+    try:
+        expected = len(timed('glob.glob', lambda: glob.glob(pattern,
+            recursive=True)))
+
+        timed('glob type, first path', lambda: next(parse(pattern)))
+        found = timed('glob type, all paths', lambda: sum(1 for _ in
+            parse(pattern)))
+        deduplicated = timed('glob type, 2 overlapping patterns',
+                lambda: sum(1 for _ in parse(pattern, overlapping)))
+
+        assert found == deduplicated == expected, (found, deduplicated,
+                expected)
+    finally:
+        if root is None:
+            shutil.rmtree(tree)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,11 +12,38 @@
 
 from __future__ import print_function
 
+import atexit
+import errno
+import fnmatch
 import os
 import operator
 from functools import partial, wraps
 from itertools import starmap, permutations
+import gc
+import hashlib
+import json
+import pickle
+import re
+import stat
+import struct
 import sys
+import threading
+import time
+from collections import deque, namedtuple, OrderedDict
+from glob import glob
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 
 if sys.version_info[0] == 3:
@@ -26,12 +53,14 @@ if sys.version_info[0] == 3:
     from urllib.parse import urlparse
     xrange = range
     import configparser as cpars
+    from io import StringIO
 else:
     iterkeys = lambda x: x.iterkeys()
     iteritems = lambda x: x.iteritems()
     isstring = lambda x: isinstance(x, basestring)
     from urlparse import urlparse
     import ConfigParser as cpars
+    from StringIO import StringIO
 
 
 class Multidict(object):
@@ -76,16 +105,376 @@ class Multidict(object):
         return iteritems(self._values)
 
 
+# ---------- config file cache ---------- #
+
+# Process-wide cache of parsed config files: absolute path -> (fingerprint,
+# items). An entry is reused for as long as the file's fingerprint is
+# unchanged.
+_config_cache = {}
+
+
+def _fingerprint(path):
+    st = os.stat(path)
+    return (getattr(st, 'st_mtime_ns', st.st_mtime), st.st_size, st.st_ino)
+
+
+def _read_into(cfp, f):
+    if hasattr(cfp, 'read_file'):
+        cfp.read_file(f)
+    else:
+        cfp.readfp(f)
+
+
+def _parse_config(path):
+    cfp = cpars.ConfigParser()
+    with open(path) as f:
+        _read_into(cfp, f)
+
+    return tuple((key, value) for sec in cfp.sections()
+            for key, value in cfp.items(sec))
+
+
+_SECTION_RE = re.compile(r'\[(?P<header>.+)\]')
+_KEY_RE = re.compile(r'\s*[=:]')
+
+
+def _sets_declared(line, declared):
+    ''' Whether INI ``line`` sets a key in ``declared``. '''
+
+    if line[:1] in ('', ' ', '\t', '\r', '\n', '#', ';'):
+        return False
+
+    return _KEY_RE.split(line, 1)[0].strip().lower() in declared
+
+
+def _default_lines(f):
+    ''' Lines of the ``DEFAULT`` section of INI file ``f``, wherever it is. '''
+
+    lines = []
+    in_defaults = False
+    for line in f:
+        if line[:1] == '[':
+            header = _SECTION_RE.match(line.strip())
+            if header is not None:
+                in_defaults = header.group('header') == cpars.DEFAULTSECT
+                continue
+
+        if in_defaults:
+            lines.append(line)
+
+    return lines
+
+
+def _stream_config(path, declared, sections=None):
+    ''' Like :func:`_parse_config`, but only yields keys in ``declared``,
+    optionally restricted to ``sections``. The file is read line by line, and
+    only sections containing a declared key (in the section itself or in
+    ``DEFAULT``) are handed to ``ConfigParser``, one at a time, for
+    interpolation. ``DEFAULT`` applies to every section, so it is collected
+    by a first, cheaper pass over the file. '''
+
+    with open(path) as f:
+        defaults = _default_lines(f)
+        f.seek(0)
+        for item in _stream_sections(f, declared, sections, defaults):
+            yield item
+
+
+def _stream_sections(f, declared, sections, defaults):
+    defaults_match = any(_sets_declared(line, declared) for line in defaults)
+
+    def section_items(name, lines, match):
+        if name in (None, cpars.DEFAULTSECT) or not (match or defaults_match):
+            return ()
+
+        if sections is not None and name not in sections:
+            return ()
+
+        cfp = cpars.ConfigParser()
+        _read_into(cfp, StringIO(''.join(['[%s]\n' % cpars.DEFAULTSECT]
+            + defaults + ['[%s]\n' % name] + lines)))
+
+        return [(key, cfp.get(name, key)) for key in cfp.options(name)
+                if key in declared]
+
+    name, lines, match = None, [], False
+    for line in f:
+        if line[:1] == '[':
+            header = _SECTION_RE.match(line.strip())
+            if header is not None:
+                for item in section_items(name, lines, match):
+                    yield item
+
+                name, lines, match = header.group('header'), [], False
+                continue
+
+        if name == cpars.DEFAULTSECT:
+            # already collected
+            continue
+
+        if not match and _sets_declared(line, declared):
+            match = True
+
+        lines.append(line)
+
+    for item in section_items(name, lines, match):
+        yield item
+
+
+def _snapshot_path(snapshot_dir, key):
+    digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+    return os.path.join(snapshot_dir, 'blargs-%s.pickle' % digest)
+
+
+def _is_trusted(f):
+    ''' Whether open file ``f`` is owned by the current user and cannot be
+    written by anyone else, so that it is safe to unpickle. '''
+
+    st = os.fstat(f.fileno())
+    getuid = getattr(os, 'getuid', None)
+    if getuid is not None and st.st_uid != getuid():
+        return False
+
+    return not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def _load_snapshot(snapshot_dir, key, fingerprint):
+    try:
+        with open(_snapshot_path(snapshot_dir, key), 'rb') as f:
+            if not _is_trusted(f):
+                return None
+            stored_key, stored_fingerprint, items = pickle.load(f)
+    except (IOError, OSError, EOFError, ValueError, TypeError,
+            pickle.UnpicklingError):
+        return None
+
+    if stored_key != key or stored_fingerprint != fingerprint:
+        return None
+
+    return items
+
+
+def _save_snapshot(snapshot_dir, key, fingerprint, items):
+    path = _snapshot_path(snapshot_dir, key)
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        # private whatever the umask, or _load_snapshot will not trust it
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL |
+                getattr(os, 'O_BINARY', 0), 0o600)
+    except OSError:
+        # snapshot is only an optimization; never fail the parse over it
+        return
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((key, fingerprint, items), f,
+                    pickle.HIGHEST_PROTOCOL)
+        getattr(os, 'replace', os.rename)(tmp, path)
+    except (IOError, OSError):
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _read_config(filename, snapshot_dir=None, declared=None, sections=None):
+    ''' Return the key/value items of INI file ``filename``. The parse is
+    cached per process and reused while the file's mtime, size and inode are
+    unchanged; if ``snapshot_dir`` is given, parses are also pickled there so
+    that a fresh process can skip INI parsing. If ``declared`` is given, only
+    those keys are loaded (see :func:`_stream_config`). '''
+
+    path = os.path.abspath(filename)
+    fingerprint = _fingerprint(path)
+
+    key = path
+    if declared is not None:
+        if sections is not None:
+            sections = tuple(sections)
+        key = (path, tuple(sorted(declared)), sections)
+
+    cached = _config_cache.get(key)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+
+    items = None
+    if snapshot_dir is not None:
+        items = _load_snapshot(snapshot_dir, key, fingerprint)
+
+    if items is None:
+        if declared is None:
+            items = _parse_config(path)
+        else:
+            items = tuple(_stream_config(path, declared, sections))
+
+        if snapshot_dir is not None:
+            _save_snapshot(snapshot_dir, key, fingerprint, items)
+
+    _config_cache[key] = (fingerprint, items)
+    return items
+
+
+def clear_config_cache():
+    ''' Drop all cached config file parses. '''
+
+    _config_cache.clear()
+
+# ---------- end config file cache ---------- #
+
+
+# ---------- layered config ---------- #
+
+
+_TRUE_STRINGS = frozenset(['1', 'true', 'yes', 'on'])
+
+
+def _thread_pool():
+    ''' ``concurrent.futures.ThreadPoolExecutor``, or ``None`` if not
+    available. Imported on first use, as it slows down start-up. '''
+
+    try:
+        from concurrent.futures import ThreadPoolExecutor
+    except ImportError:
+        return None
+
+    return ThreadPoolExecutor
+
+
+def _parallel_map(func, items, max_workers=8):
+    ''' ``map`` that runs ``func`` on a thread pool when there is more than
+    one item and threads are available. '''
+
+    items = list(items)
+    executor = _thread_pool() if len(items) > 1 else None
+    if executor is None:
+        return [func(item) for item in items]
+
+    with executor(max_workers=min(max_workers, len(items))) as pool:
+        return list(pool.map(func, items))
+
+
+def _config_files(path):
+    ''' Config files at ``path``: the ``*.ini`` files of a directory in name
+    order, the file itself, or none if it does not exist. '''
+
+    if os.path.isdir(path):
+        return sorted(glob(os.path.join(path, '*.ini')))
+
+    if os.path.exists(path):
+        return [path]
+
+    return []
+
+
+def _path_state(path):
+    ''' Fingerprints of the config files at ``path``, for change detection.
+    '''
+
+    state = []
+    for f in _config_files(path):
+        try:
+            state.append((f, _fingerprint(f)))
+        except OSError:
+            # removed since listing
+            pass
+
+    return tuple(state)
+
+
+class _ConfigLayer(object):
+    ''' One source of a layered configuration: an INI file, or a directory
+    whose ``*.ini`` files are read in name order. Missing sources are
+    treated as empty. '''
+
+    def __init__(self, path):
+        self.path = path
+        self.values = {}
+        self._state = None
+
+    def refresh(self):
+        ''' Reload the layer if any of its files changed. Returns the
+        previous values if so, and ``None`` otherwise. '''
+
+        state = _path_state(self.path)
+        if state == self._state:
+            return None
+
+        values = {}
+        for items in _parallel_map(_read_config, [f for f, _ in state]):
+            values.update(items)
+
+        previous = self.values
+        self.values, self._state = values, state
+        return previous
+
+
+class _LayeredConfig(object):
+    ''' Merged view over :class:`_ConfigLayer`s, where later layers take
+    precedence over earlier ones. The view is rebuilt only when a layer
+    changes, and then only for the keys of the changed layers. '''
+
+    def __init__(self, parser):
+        self._parser = parser
+        self._layers = []
+        self._merged = {}
+        self._view = None
+        self._declared = None
+
+    def add(self, path):
+        self._layers.append(_ConfigLayer(path))
+        self._view = None
+
+    def _lookup(self, key):
+        for layer in reversed(self._layers):
+            if key in layer.values:
+                return layer.values[key]
+
+        return _ArgumentReader.UNSPECIFIED
+
+    def view(self):
+        ''' Return merged values of declared options. '''
+
+        changed = set()
+        for previous, layer in zip(_parallel_map(_ConfigLayer.refresh,
+                self._layers), self._layers):
+            if previous is not None:
+                changed.update(previous)
+                changed.update(layer.values)
+
+        for key in changed:
+            value = self._lookup(key)
+            if value is _ArgumentReader.UNSPECIFIED:
+                self._merged.pop(key, None)
+            else:
+                self._merged[key] = value
+
+        declared = len(self._parser._readers)
+        if changed or self._view is None or declared != self._declared:
+            readers = self._parser._readers
+            self._view = dict((key, value) for key, value in
+                    iteritems(self._merged) if key in readers)
+            self._declared = declared
+
+        return self._view
+
+# ---------- end layered config ---------- #
+
+
 class _ConfigCaster(object):
-    def __init__(self, parent):
+    _completion = 'file'
+
+    def __init__(self, parent, snapshot_dir=None, declared_only=False,
+            sections=None):
         self._parent = parent
+        self._snapshot_dir = snapshot_dir
+        self._declared_only = declared_only
+        self._sections = sections
 
     def __call__(self, filename):
-        cfp = cpars.ConfigParser()
-        cfp.readfp(open(filename))
-        for sec in cfp.sections():
-            for key, value in cfp.items(sec):
-                yield key, value
+        declared = None
+        if self._declared_only:
+            declared = frozenset(self._parent._readers)
+
+        return iter(_read_config(filename, self._snapshot_dir, declared,
+            self._sections))
 
 
 class _RangeCaster(object):
@@ -114,23 +503,62 @@ class _RangeCaster(object):
 
 
 class _DirectoryOpenerCaster(object):
+    _completion = 'directory'
+    _io = True
+
     def __init__(self, create):
         self._create = create
+        self._side_effects = create
 
     def __call__(self, name):
-        if not os.path.exists(name):
+        try:
+            mode = os.stat(name).st_mode
+        except OSError:
             if self._create:
                 os.makedirs(name)
                 return name
             raise IOError('%s does not exist' % name)
 
-        if not os.path.isdir(name):
+        if not stat.S_ISDIR(mode):
             raise IOError('%s is not directory' % name)
 
         return name
 
+    def _check(self, name):
+        ''' As a call, without creating the directory. '''
+
+        if self._create and not os.path.lexists(name):
+            return name
+
+        return _DirectoryOpenerCaster(False)(name)
+
+
+def _check_openable(name, mode):
+    ''' Raise ``IOError`` if ``open(name, mode)`` would obviously fail,
+    without opening (and so creating or truncating) the file. '''
+
+    def fail(code):
+        raise IOError(code, os.strerror(code), name)
+
+    if any(c in mode for c in 'wax+'):
+        if not os.path.isdir(os.path.dirname(name) or os.curdir):
+            fail(errno.ENOENT)
+        if 'x' in mode and os.path.lexists(name):
+            fail(errno.EEXIST)
+    elif not os.path.exists(name):
+        fail(errno.ENOENT)
+
+    if os.path.isdir(name):
+        fail(errno.EISDIR)
+
+    return name
+
 
 class _FileOpenerCaster(object):
+    _side_effects = True
+    _completion = 'file'
+    _io = True
+
     def __init__(self, mode=None, buffering=None):
         self._kw = {}
         if mode is not None:
@@ -141,182 +569,993 @@ class _FileOpenerCaster(object):
     def __call__(self, *args):
         return open(*args, **self._kw)
 
+    def _check(self, name):
+        return _check_openable(name, self._kw.get('mode', 'r'))
 
-# ---------- decorators ---------- #
 
+def _decompressed(raw):
+    ''' ``raw``, a buffered binary file, decompressed according to its magic
+    bytes. '''
 
-def _names_to_options(f):
-    @wraps(f)
-    def inner(*args, **kwargs):
-        new_args = []
-        for arg in args[1:]:
-            if isstring(arg):
-                arg = args[0]._options[arg]
+    peek = getattr(raw, 'peek', None)
+    if peek is None:
+        return raw
 
-            new_args.append(arg)
+    magic = peek(6)[:6]
+    if magic.startswith(b'\x1f\x8b'):
+        import gzip
+        return gzip.GzipFile(fileobj=raw)
+    if magic.startswith(b'BZh'):
+        import bz2
+        return bz2.BZ2File(raw)
+    if magic.startswith(b'\xfd7zXZ\x00'):
+        import lzma
+        return lzma.LZMAFile(raw)
+    if magic.startswith(b'\x28\xb5\x2f\xfd'):
+        if zstandard is None:
+            raise IOError('zstandard is required to read zstd data')
+        return zstandard.ZstdDecompressor().stream_reader(raw, closefd=False)
 
-        return f(*[args[0]] + new_args, **kwargs)
+    return raw
 
-    return inner
 
+class _Records(object):
+    ''' Iterable over the records of a stream, read in chunks of
+    ``buffer_size`` bytes. Closing it closes the stream, unless it is stdin.
+    '''
 
-def _options_to_names(f):
-    ''' Convert any :class:`Option`s to names. '''
+    def __init__(self, raw, owned, sep, encoding, buffer_size, strip_cr):
+        self._raw = raw
+        self._owned = owned
+        self._stream = _decompressed(raw)
+        self._sep = sep
+        self._encoding = encoding
+        self._buffer_size = buffer_size
+        self._strip_cr = strip_cr
 
-    @wraps(f)
-    def inner(*args, **kwargs):
-        new_args = []
-        for arg in args[1:]:
-            if isinstance(arg, Option) and not isinstance(arg, Group):
-                arg = arg.argname
+    def __iter__(self):
+        sep = self._sep
+        pending = ''
+        decode = None
+        if self._encoding is None:
+            sep = sep.encode('latin-1') if not isinstance(sep, bytes) else sep
+            pending = b''
+        else:
+            import codecs
+            decode = codecs.getincrementaldecoder(self._encoding)().decode
 
-            new_args.append(arg)
+        cr = b'\r' if decode is None else '\r'
+        read = self._stream.read
+        try:
+            while True:
+                chunk = read(self._buffer_size)
+                if decode is not None:
+                    chunk = decode(chunk, not chunk)
+
+                if not chunk:
+                    break
+
+                records = (pending + chunk).split(sep)
+                pending = records.pop()
+                for record in records:
+                    if self._strip_cr and record.endswith(cr):
+                        record = record[:-1]
+                    yield record
+
+            if self._strip_cr and pending.endswith(cr):
+                pending = pending[:-1]
+            if pending:
+                yield pending
+        finally:
+            self.close()
+
+    def close(self):
+        if self._stream is not self._raw:
+            self._stream.close()
+        if self._owned:
+            self._raw.close()
 
-        return f(*[args[0]] + new_args, **kwargs)
+    def __enter__(self):
+        return self
 
-    return inner
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
 
-def _verify_args_exist(f):
-    @wraps(f)
-    def inner(*args, **kwargs):
-        def raise_error(name):
-            raise ValueError('%s not known' % name)
+class _RecordsCaster(object):
+    _side_effects = True
+    _completion = 'file'
+    _io = True
 
-        self = args[0]
-        for arg in args[1:]:
-            if isstring(arg) and arg not in self._readers:
-                raise_error(arg)
+    def __init__(self, sep, encoding, buffer_size, strip_cr=False):
+        self._sep = sep
+        self._encoding = encoding
+        self._buffer_size = buffer_size
+        self._strip_cr = strip_cr
 
-        return f(*args, **kwargs)
+    def __call__(self, name):
+        if name == '-':
+            raw = getattr(sys.stdin, 'buffer', sys.stdin)
+            owned = False
+        else:
+            raw = open(name, 'rb', self._buffer_size)
+            owned = True
 
-    return inner
+        try:
+            return _Records(raw, owned, self._sep, self._encoding,
+                    self._buffer_size, self._strip_cr)
+        except Exception:
+            if owned:
+                raw.close()
+            raise
 
+    def _check(self, name):
+        if name == '-':
+            return name
+        return _check_openable(name, 'rb')
 
-def _localize_all(f):
-    @wraps(f)
-    def inner(*args, **kwargs):
-        args = list(args)
-        self = args[0]
-        new_args = []
-        for arg in args[1:]:
-            if isstring(arg):
-                arg = self._localize(arg)
-            new_args.append(arg)
-        args[1:] = new_args
-        return f(*args, **kwargs)
 
-    return inner
+# _AtomicFiles neither committed nor discarded yet
+_pending_outputs = set()
 
 
-def localize(f):
-    @wraps(f)
-    def inner(*args, **kwargs):
-        args = list(args)
-        self = args[0]
-#        args[1:] = [self._localize(x) for x in args[1]]
-        args[1] = self._localize(args[1])
+def _discard_pending_outputs():
+    for output in list(_pending_outputs):
+        output.discard()
 
-        return f(*args, **kwargs)
+atexit.register(_discard_pending_outputs)
 
-    return inner
 
-# ---------- end decorators ---------- #
+def _existing_mode(path):
+    ''' Permission bits of ``path``, or ``None`` if it does not exist. '''
 
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        return None
 
-# ---------- exceptions ---------- #
 
+class _AtomicFile(object):
+    ''' File written to a temporary file in the directory of ``path``, which
+    replaces ``path`` on ``close``, or is removed on ``discard``. '''
 
-class ArgumentError(ValueError):
-    ''' Root class of all arguments that are thrown due to user input which
-    violates a rule set by the parser. In other words, errors of this type
-    should be caught and communicated to the user some how. The default
-    behavior is to signal the particular error and show the `usage`.'''
+    def __init__(self, path, mode, buffer_size):
+        import binascii
 
-    pass
+        directory, base = os.path.split(os.path.abspath(path))
+        flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY',
+                0)
+        for attempt in range(100):
+            self._temp = os.path.join(directory, '.%s.%s.tmp' % (base,
+                binascii.hexlify(os.urandom(6)).decode('ascii')))
+            try:
+                # unlike mkstemp's 0600, lets the umask decide, as open does
+                fd = os.open(self._temp, flags, 0o666)
+                break
+            except OSError as e:
+                if e.errno != errno.EEXIST or attempt == 99:
+                    raise
 
+        try:
+            self._file = os.fdopen(fd, mode, buffer_size)
+        except Exception:
+            os.close(fd)
+            os.remove(self._temp)
+            raise
 
-class FormatError(ArgumentError):
-    ''' Argument not formatted correctly. '''
-    pass
+        self.name = path
+        self.write = self._file.write
+        self._done = False
+        _pending_outputs.add(self)
 
+    def __getattr__(self, name):
+        return getattr(self._file, name)
 
-class ConditionError(ArgumentError):
-    ''' Condition not met. '''
+    @property
+    def closed(self):
+        return self._done
 
-    def __init__(self, argname, condition):
-        super(ConditionError, self).__init__()
-        self.argname = argname
-        self.condition = condition
+    def close(self):
+        ''' Flush and sync the data to disk, and replace the file. '''
 
-    def __str__(self):
-        return '%s required unless %s' % (self.argname, self.condition)
+        if self._done:
+            return
 
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            mode = _existing_mode(self.name)
+            if mode is not None:
+                os.chmod(self._temp, mode)
+            getattr(os, 'replace', os.rename)(self._temp, self.name)
+        except Exception:
+            self.discard()
+            raise
+
+        self._done = True
+        _pending_outputs.discard(self)
+
+    def discard(self):
+        ''' Drop the data written, leaving the file untouched. '''
+
+        if self._done:
+            return
+
+        self._done = True
+        _pending_outputs.discard(self)
+        try:
+            self._file.close()
+        except Exception:
+            pass
+        try:
+            os.remove(self._temp)
+        except OSError:
+            pass
 
-class MissingRequiredArgumentError(ArgumentError):
-    ''' Required argument not specified. '''
+    def __enter__(self):
+        return self
 
-    def __init__(self, arg):
-        if isinstance(arg, Option):
-            arg = arg.argname
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
 
-        super(MissingRequiredArgumentError, self).__init__(
-                'No value passed for %s' % arg)
 
+class _OutputFileCaster(object):
+    _side_effects = True
+    _completion = 'file'
+    _io = True
 
-class ManyAllowedNoneSpecifiedArgumentError(ArgumentError):
-    ''' An argument out of a list of required is missing.
-    e.g., one of -a and -b is required and neither is specified. '''
+    def __init__(self, mode, buffer_size, atomic):
+        self._mode = mode
+        self._buffer_size = buffer_size
+        self._atomic = atomic
 
-    def __init__(self, allowed):
-        super(ManyAllowedNoneSpecifiedArgumentError, self).__init__(('[%s] not'
-                + ' specified') % ', '.join(sorted(map(str, allowed))))
+    def __call__(self, name):
+        if not self._atomic:
+            return open(name, self._mode, self._buffer_size)
 
+        return _AtomicFile(name, self._mode, self._buffer_size)
 
-class UnspecifiedArgumentError(ArgumentError):
-    ''' User supplies argument that isn't specified. '''
+    def _check(self, name):
+        return _check_openable(name, self._mode)
 
-    message = 'illegal option {0}'
 
-    def __init__(self, arg):
-        super(UnspecifiedArgumentError,
-                self).__init__(UnspecifiedArgumentError.message.format(arg))
+class _Tree(object):
+    ''' Iterable over the files under ``root`` whose names match ``pattern``,
+    as ``DirEntry`` objects; each iteration walks the tree again. '''
 
+    def __init__(self, root, pattern, recursive, workers):
+        self.root = root
+        self._match = re.compile(fnmatch.translate(pattern)).match
+        self._recursive = recursive
+        self._workers = workers
 
-class MultipleSpecifiedArgumentError(ArgumentError):
-    ''' Multiple of the same argument specified. '''
-    pass
+    def _scan(self, path):
+        ''' Matching files and subdirectories of ``path``. '''
 
+        files = []
+        subdirs = []
+        try:
+            with scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if self._recursive:
+                            subdirs.append(entry.path)
+                    elif self._match(entry.name) and entry.is_file():
+                        files.append(entry)
+        except OSError:
+            # like os.walk, skip directories that cannot be listed
+            pass
+
+        return files, subdirs
 
-class DependencyError(ArgumentError):
-    ''' User specified an argument that requires another, unspecified argument.
-    '''
+    def __iter__(self):
+        if self._workers > 1 and _thread_pool() is not None:
+            return self._walk_parallel()
+        return self._walk()
 
-    def __init__(self, arg1, arg2):
-        super(DependencyError, self).__init__('%s requires %s' % (arg1, arg2))
+    def _walk(self):
+        directories = deque([self.root])
+        while directories:
+            try:
+                with scandir(directories.popleft()) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if self._recursive:
+                                    directories.append(entry.path)
+                            elif self._match(entry.name) and entry.is_file():
+                                yield entry
+                        except OSError:
+                            pass
+            except OSError:
+                # like os.walk, skip directories that cannot be listed
+                pass
+
+    def _walk_parallel(self):
+        directories = deque([self.root])
+        scans = deque()
+        with _thread_pool()(max_workers=self._workers) as pool:
+            while directories or scans:
+                # keep a bounded number of directories listed ahead
+                while directories and len(scans) < 2 * self._workers:
+                    scans.append(pool.submit(self._scan,
+                        directories.popleft()))
+
+                files, subdirs = scans.popleft().result()
+                directories.extend(subdirs)
+                for entry in files:
+                    yield entry
+
+
+class _TreeCaster(object):
+    _completion = 'directory'
+    _io = True
+
+    def __init__(self, pattern, recursive, workers):
+        self._pattern = pattern
+        self._recursive = recursive
+        self._workers = workers
 
+    def __call__(self, name):
+        return _Tree(_DirectoryOpenerCaster(False)(name), self._pattern,
+                self._recursive, self._workers)
 
-class ConflictError(ArgumentError):
-    ''' User specified an argument that conflicts another specified argument.
-    '''
 
-    def __init__(self, offender1, offender2):
-        super(ConflictError, self).__init__('%s conflicts with %s' %
-                (offender1, offender2))
+# ---------- glob ---------- #
 
+_GLOB_MAGIC = re.compile('[*?[]')
 
-class FailedConditionError(ArgumentError):
-    ''' Condition failed. '''
-    pass
+# pattern component -> compiled regex
+_glob_regexes = {}
 
 
-class MissingValueError(ArgumentError):
-    ''' Argument flag specified without value. '''
-    pass
+def _glob_match(part):
+    match = _glob_regexes.get(part)
+    if match is None:
+        match = _glob_regexes[part] = re.compile(fnmatch.translate(part)).match
+    return match
 
 
-class InvalidEnumValueError(ArgumentError):
-    ''' Enum value provided not allowed. '''
+def _listdir(path):
+    ''' ``DirEntry`` objects of ``path``, empty if it cannot be listed. '''
+
+    try:
+        with scandir(path or os.curdir) as entries:
+            return list(entries)
+    except OSError:
+        return []
+
+
+def _walk_listings(path):
+    ''' (directory, listing) for ``path`` and each directory under it, not
+    following symbolic links and skipping hidden directories. '''
+
+    directories = [path]
+    while directories:
+        directory = directories.pop()
+        listing = _listdir(directory)
+        yield directory, listing
+
+        directories.extend(reversed([entry.path if directory else entry.name
+            for entry in listing if entry.name[0] != '.' and
+            entry.is_dir(follow_symlinks=False)]))
+
+
+def _glob_in(path, parts, listing=None):
+    ''' Paths under ``path`` matching ``parts``, the components of a
+    pattern; ``listing`` is that of ``path``, if already made. '''
+
+    if not parts:
+        yield path
+        return
+
+    part = parts[0]
+    rest = parts[1:]
+
+    if part == '**':
+        if not rest and path:
+            yield os.path.join(path, '')
+
+        for directory, entries in _walk_listings(path):
+            if rest:
+                for match in _glob_in(directory, rest, entries):
+                    yield match
+            else:
+                for entry in entries:
+                    if entry.name[0] != '.':
+                        yield entry.path if directory else entry.name
+
+    elif not _GLOB_MAGIC.search(part):
+        child = os.path.join(path, part)
+        if rest:
+            for match in _glob_in(child, rest):
+                yield match
+        elif os.path.lexists(child):
+            yield child
+
+    else:
+        match = _glob_match(part)
+        hidden = part.startswith('.')
+        if listing is None:
+            listing = _listdir(path)
+
+        for entry in listing:
+            name = entry.name
+            if not match(name) or (name[0] == '.' and not hidden):
+                continue
+
+            # entry.path joins like os.path.join, except under os.curdir
+            child = entry.path if path else name
+            if not rest:
+                yield child
+            elif entry.is_dir():
+                for found in _glob_in(child, rest):
+                    yield found
+
+
+def _iglob(pattern):
+    ''' Lazily yield the paths matching ``pattern``, like ``glob.iglob`` with
+    ``recursive=True``, listing each directory with ``scandir``. '''
+
+    if not _GLOB_MAGIC.search(pattern):
+        if os.path.lexists(pattern):
+            yield pattern
+        return
+
+    drive, rest = os.path.splitdrive(pattern)
+    if os.altsep:
+        rest = rest.replace(os.altsep, os.sep)
+
+    base = drive
+    if rest.startswith(os.sep):
+        base += os.sep
+        rest = rest.lstrip(os.sep)
+
+    for path in _glob_in(base, rest.split(os.sep)):
+        yield path
+
+
+def _unique_paths(iterables):
+    ''' Paths of ``iterables``, in order, skipping those already yielded. '''
+
+    seen = set()
+    for paths in iterables:
+        if paths is None:
+            continue
+
+        for path in paths:
+            key = os.path.normpath(path)
+            if key not in seen:
+                seen.add(key)
+                yield path
+
+
+class _GlobCaster(object):
+    # results are generators, which cannot be reused
+    _side_effects = True
+    _merge = staticmethod(_unique_paths)
+
+    def __call__(self, pattern):
+        return _iglob(pattern)
+
+
+def _merge_hook(reader):
+    ''' ``_merge`` of the casts of ``reader`` (or a list of them), if any:
+    called with the list of cast values, it returns the argument's value. '''
+
+    if isinstance(reader, list):
+        reader = reader[0]
+
+    while isinstance(reader, Caster):
+        merge = getattr(reader._cast, '_merge', None)
+        if merge is not None:
+            return merge
+        reader = reader._reader
+
+    return None
+
+# ---------- end glob ---------- #
+
+
+def _has_side_effects(reader):
+    ''' Whether casting the value of ``reader`` has side effects (e.g.,
+    opening files), so that its results must not be reused. '''
+
+    while isinstance(reader, Caster):
+        if getattr(reader._cast, '_side_effects', False):
+            return True
+        reader = reader._reader
+
+    return False
+
+
+def _is_async(reader):
+    ''' Whether the last cast of ``reader`` is a coroutine function. '''
+
+    if not isinstance(reader, Caster):
+        return False
+
+    import inspect
+    cast = reader._cast
+    return (inspect.iscoroutinefunction(cast) or
+            inspect.iscoroutinefunction(getattr(cast, '__call__', None)))
+
+
+class _Awaited(object):
+    ''' Reader standing in for ``reader``, holding the result of awaiting its
+    cast. '''
+
+    def __init__(self, reader, value):
+        self._reader = reader
+        self._value = value
+
+    def getvalue(self):
+        return self._value
+
+    def is_specified(self):
+        return self._reader.is_specified()
+
+    def is_resolvable(self):
+        return self._reader.is_resolvable()
+
+
+def _getvalue(reader):
+    return reader.getvalue()
+
+
+def _checked(reader):
+    ''' Value of ``reader`` as ``reader.getvalue()`` would return it, but
+    without side effects: casts that have them are replaced by their
+    ``_check``, which validates the value without acting on it, and are
+    skipped if they have none. '''
+
+    if not isinstance(reader, Caster):
+        return reader.getvalue()
+
+    try:
+        v = _checked(reader._reader)
+        if v is _ArgumentReader.UNSPECIFIED:
+            return None
+
+        cast = reader._cast
+        if getattr(cast, '_side_effects', False):
+            cast = getattr(cast, '_check', None)
+            if cast is None:
+                return v
+
+        return cast(v)
+    except ValueError:
+        raise FormatError
+
+
+def _does_io(reader):
+    ''' Whether casting the value of ``reader`` is I/O-bound (e.g., opening
+    files), so that it may run concurrently with others. '''
+
+    while isinstance(reader, Caster):
+        if getattr(reader._cast, '_io', False):
+            return True
+        reader = reader._reader
+
+    return False
+
+
+def _close_values(values):
+    ''' Close those of ``values`` that can be closed, ignoring errors.
+    Atomic output files are discarded. '''
+
+    for value in values:
+        close = getattr(value, 'discard', None) or getattr(value, 'close',
+                None)
+        if close is not None:
+            try:
+                close()
+            except Exception:
+                pass
+
+
+class _Prefetched(object):
+    ''' Values of I/O-bound readers, cast concurrently for
+    :py:meth:`Parser.concurrent_io`. Called with a reader, returns its value
+    or raises its error, as ``reader.getvalue()`` would. '''
+
+    def __init__(self, readers, max_workers):
+        self._readers = readers
+        self._outcomes = dict(zip(map(id, readers),
+            _parallel_map(self._attempt, readers, max_workers)))
+
+    @staticmethod
+    def _attempt(reader):
+        try:
+            return reader.getvalue(), None
+        except Exception as e:
+            return None, e
+
+    def __call__(self, reader):
+        outcome = self._outcomes.get(id(reader))
+        if outcome is None:
+            return reader.getvalue()
+
+        value, error = outcome
+        if error is not None:
+            raise error
+        return value
+
+    def values(self):
+        ''' Values that were cast successfully. '''
+
+        return [value for value, error in self._outcomes.values() if error
+                is None]
+
+
+_CacheInfo = namedtuple('CacheInfo', 'hits misses maxsize currsize')
+
+
+class _ParseCache(object):
+    ''' LRU cache of assigned values by command line, for
+    :py:meth:`Parser.memoize`. Each entry also records the state of the
+    config files its values came from, and is dropped when they change. '''
+
+    def __init__(self, maxsize):
+        self._maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                assigned, state = entry
+                if all(_path_state(path) == path_state for path, path_state
+                        in state):
+                    self._entries[key] = entry
+                    self.hits += 1
+                    return _ParseCache._copy(assigned)
+
+            self.misses += 1
+            return None
+
+    @staticmethod
+    def _copy(assigned):
+        # lists of multiple values are copied, so callers cannot modify
+        # cached values
+        return dict((k, list(v) if isinstance(v, list) else v) for k, v in
+                iteritems(assigned))
+
+    @staticmethod
+    def state(paths):
+        return tuple((path, _path_state(path)) for path in paths)
+
+    def put(self, key, assigned, state):
+        with self._lock:
+            self._entries[key] = (_ParseCache._copy(assigned), state)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def info(self):
+        return _CacheInfo(self.hits, self.misses, self._maxsize,
+                len(self._entries))
+
+
+_SHELL_SPECIAL_RE = re.compile(r'[\'"\\]')
+
+
+def _split_line(line):
+    ''' Split ``line`` like ``shlex.split``, skipping the (slow) shell lexer
+    for lines without quotes or escapes. '''
+
+    if _SHELL_SPECIAL_RE.search(line) is None:
+        return line.split()
+
+    import shlex
+    return shlex.split(line)
+
+
+class _Trie(object):
+    ''' Prefix tree of words, where each node lists the words below it, so
+    that the completions of a prefix are found in time proportional to the
+    prefix length. '''
+
+    def __init__(self, words=()):
+        self._root = {}
+        for word in words:
+            self.add(word)
+
+    def add(self, word):
+        node = self._root
+        for char in word:
+            node = node.setdefault(char, {})
+            node.setdefault(None, []).append(word)
+
+    def complete(self, prefix):
+        node = self._root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+
+        return node.get(None, [])
+
+
+def _edit_distance(a, b):
+    ''' Levenshtein distance between ``a`` and ``b``. '''
+
+    if len(a) < len(b):
+        a, b = b, a
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a):
+        current = [i + 1]
+        for j, char_b in enumerate(b):
+            current.append(min(previous[j + 1] + 1, current[j] + 1,
+                previous[j] + (char_a != char_b)))
+        previous = current
+
+    return previous[-1]
+
+
+def _transposition_distance(a, b):
+    ''' Optimal string alignment distance between ``a`` and ``b``: like
+    :func:`_edit_distance`, but swapping two adjacent characters costs 1. '''
+
+    before = None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a):
+        current = [i + 1]
+        for j, char_b in enumerate(b):
+            distance = min(previous[j + 1] + 1, current[j] + 1,
+                previous[j] + (char_a != char_b))
+            if (i and j and char_a == b[j - 1] and a[i - 1] == char_b and
+                    char_a != char_b):
+                distance = min(distance, before[j - 1] + 1)
+            current.append(distance)
+        before, previous = previous, current
+
+    return previous[-1]
+
+
+class _BKTree(object):
+    ''' Burkhard-Keller tree of words, finding the words within an edit
+    distance of a query without comparing it to every word. '''
+
+    def __init__(self, words=()):
+        self._root = None
+        for word in words:
+            self.add(word)
+
+    def add(self, word):
+        if self._root is None:
+            self._root = (word, {})
+            return
+
+        node = self._root
+        while True:
+            distance = _edit_distance(word, node[0])
+            if distance == 0:
+                return
+
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (word, {})
+                return
+
+            node = child
+
+    def search(self, word, radius):
+        ''' ``(distance, word)`` pairs within ``radius`` of ``word``, closest
+        first. '''
+
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node_word, children = stack.pop()
+            distance = _edit_distance(word, node_word)
+            if distance <= radius:
+                found.append((distance, node_word))
+
+            for d in xrange(max(1, distance - radius), distance + radius + 1):
+                child = children.get(d)
+                if child is not None:
+                    stack.append(child)
+
+        return sorted(found)
+
+
+# ---------- decorators ---------- #
+
+
+def _names_to_options(f):
+    @wraps(f)
+    def inner(*args, **kwargs):
+        new_args = []
+        for arg in args[1:]:
+            if isstring(arg):
+                arg = args[0]._options[arg]
+
+            new_args.append(arg)
+
+        return f(*[args[0]] + new_args, **kwargs)
+
+    return inner
+
+
+def _options_to_names(f):
+    ''' Convert any :class:`Option`s to names. '''
+
+    @wraps(f)
+    def inner(*args, **kwargs):
+        new_args = []
+        for arg in args[1:]:
+            if isinstance(arg, Option) and not isinstance(arg, Group):
+                arg = arg.argname
+
+            new_args.append(arg)
+
+        return f(*[args[0]] + new_args, **kwargs)
+
+    return inner
+
+
+def _verify_args_exist(f):
+    @wraps(f)
+    def inner(*args, **kwargs):
+        def raise_error(name):
+            raise ValueError('%s not known' % name)
+
+        self = args[0]
+        for arg in args[1:]:
+            if isstring(arg) and arg not in self._readers:
+                raise_error(arg)
+
+        return f(*args, **kwargs)
+
+    return inner
+
+
+def _localize_all(f):
+    @wraps(f)
+    def inner(*args, **kwargs):
+        args = list(args)
+        self = args[0]
+        new_args = []
+        for arg in args[1:]:
+            if isstring(arg):
+                arg = self._localize(arg)
+            new_args.append(arg)
+        args[1:] = new_args
+        return f(*args, **kwargs)
+
+    return inner
+
+
+def localize(f):
+    @wraps(f)
+    def inner(*args, **kwargs):
+        args = list(args)
+        self = args[0]
+#        args[1:] = [self._localize(x) for x in args[1]]
+        args[1] = self._localize(args[1])
+
+        return f(*args, **kwargs)
+
+    return inner
+
+# ---------- end decorators ---------- #
+
+
+# ---------- exceptions ---------- #
+
+
+class ArgumentError(ValueError):
+    ''' Root class of all arguments that are thrown due to user input which
+    violates a rule set by the parser. In other words, errors of this type
+    should be caught and communicated to the user some how. The default
+    behavior is to signal the particular error and show the `usage`.
+    ``names`` lists the arguments involved, if known.'''
+
+    names = ()
+
+
+class FormatError(ArgumentError):
+    ''' Argument not formatted correctly. '''
+    pass
+
+
+class ConditionError(ArgumentError):
+    ''' Condition not met. '''
+
+    def __init__(self, argname, condition):
+        super(ConditionError, self).__init__()
+        self.argname = argname
+        self.condition = condition
+
+    def __str__(self):
+        return '%s required unless %s' % (self.argname, self.condition)
+
+
+class MissingRequiredArgumentError(ArgumentError):
+    ''' Required argument not specified. '''
+
+    def __init__(self, arg):
+        if isinstance(arg, Option):
+            arg = arg.argname
+
+        super(MissingRequiredArgumentError, self).__init__(
+                'No value passed for %s' % arg)
+
+
+class ManyAllowedNoneSpecifiedArgumentError(ArgumentError):
+    ''' An argument out of a list of required is missing.
+    e.g., one of -a and -b is required and neither is specified. '''
+
+    def __init__(self, allowed):
+        super(ManyAllowedNoneSpecifiedArgumentError, self).__init__(('[%s] not'
+                + ' specified') % ', '.join(sorted(map(str, allowed))))
+
+
+class UnspecifiedArgumentError(ArgumentError):
+    ''' User supplies argument that isn't specified. ``suggestions`` lists
+    the most similar argument labels. '''
+
+    message = 'illegal option {0}'
+    suggestions = ()
+
+    def __init__(self, arg):
+        super(UnspecifiedArgumentError,
+                self).__init__(UnspecifiedArgumentError.message.format(arg))
+
+
+class AmbiguousArgumentError(ArgumentError):
+    ''' User supplies an abbreviated argument label matching several
+    arguments. '''
+
+    def __init__(self, arg, candidates):
+        super(AmbiguousArgumentError, self).__init__(
+                'ambiguous option %s could be %s' % (arg,
+                    ', '.join(sorted(candidates))))
+        self.candidates = sorted(candidates)
+
+
+class MultipleSpecifiedArgumentError(ArgumentError):
+    ''' Multiple of the same argument specified. '''
+    pass
+
+
+class DependencyError(ArgumentError):
+    ''' User specified an argument that requires another, unspecified argument.
+    '''
+
+    def __init__(self, arg1, arg2):
+        super(DependencyError, self).__init__('%s requires %s' % (arg1, arg2))
+
+
+class ConflictError(ArgumentError):
+    ''' User specified an argument that conflicts another specified argument.
+    '''
+
+    def __init__(self, offender1, offender2):
+        super(ConflictError, self).__init__('%s conflicts with %s' %
+                (offender1, offender2))
+
+
+class FailedConditionError(ArgumentError):
+    ''' Condition failed. '''
+    pass
+
+
+class MissingValueError(ArgumentError):
+    ''' Argument flag specified without value. '''
+    pass
+
+
+class InvalidEnumValueError(ArgumentError):
+    ''' Enum value provided not allowed. '''
     pass
 
 # ---------- end exceptions ---------- #
@@ -435,6 +1674,7 @@ class Option(Condition):
         self._conditions = []
         self._allows_multiple = False
         self._description = None
+        self._choices = None
 
     def _copy(self):
         c = super(Option, self)._copy()
@@ -453,6 +1693,7 @@ class Option(Condition):
         '''
 
         self._description = description
+        self._parser._help_changed()
         return self
 
     def requires(self, *conditions):
@@ -504,6 +1745,22 @@ class Option(Condition):
         self._parser._set_default(self.argname, value)
         return self
 
+    def default_factory(self, factory):
+        ''' Provide a callable computing the default value for this argument.
+        ``factory`` is called without arguments, only when the default is
+        actually used, and at most once per :class:`Parser`. For example:
+
+        ::
+
+            with Parser(locals()) as p:
+                p.int('workers').default_factory(multiprocessing.cpu_count)
+
+        Checking whether the argument is resolvable in conditions does not
+        call ``factory``. '''
+
+        self._parser._set_default(self.argname, _DefaultFactory(factory))
+        return self
+
     def environment(self):
         ''' Pull argument value from OS environment if unspecified. The case of
         the argument name, all lower, and all upper are all tried. For example,
@@ -542,6 +1799,8 @@ class Option(Condition):
 
         self._parser._readers[self.argname] = Caster(
                 self._parser._readers[self.argname], cast)
+        self._parser._side_effects = None
+        self._parser._help_changed()
 
         return self
 
@@ -678,6 +1937,8 @@ class _ArgumentReader(object):
 
     def default(self):
         if self._default is not _ArgumentReader.UNSPECIFIED:
+            if isinstance(self._default, _DefaultFactory):
+                return self._default()
             return self._default
         return self.__class__.class_default()
 
@@ -695,6 +1956,20 @@ class _ArgumentReader(object):
         return self.default()
 
 
+class _DefaultFactory(object):
+    ''' Default value computed by ``factory`` the first time it is needed.
+    '''
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._value = _ArgumentReader.UNSPECIFIED
+
+    def __call__(self):
+        if self._value is _ArgumentReader.UNSPECIFIED:
+            self._value = self._factory()
+        return self._value
+
+
 class _MultiWordArgumentReader(_ArgumentReader):
     def consume_or_skip(self, arg):
         if self.parent._is_argument_label(arg):
@@ -784,6 +2059,42 @@ class Caster(object):
         self._reader._set_default(default)
 
 
+def _is_flag(reader):
+    while isinstance(reader, Caster):
+        reader = reader._reader
+
+    return isinstance(reader, _FlagArgumentReader)
+
+
+def _completion_kind(reader):
+    ''' What the shell should complete as the value of ``reader``: 'flag'
+    (no value), 'file', 'directory', or 'value' (anything). '''
+
+    if _is_flag(reader):
+        return 'flag'
+
+    while isinstance(reader, Caster):
+        kind = getattr(reader._cast, '_completion', None)
+        if kind is not None:
+            return kind
+        reader = reader._reader
+
+    return 'value'
+
+
+def _is_given(reader):
+    ''' Whether ``reader`` (or a list of them) holds a user-given value, as
+    opposed to a default. '''
+
+    if isinstance(reader, list):
+        return True
+
+    if _is_flag(reader):
+        return bool(reader.is_resolvable())
+
+    return reader.is_specified()
+
+
 # ---------- Argument readers ---------- #
 
 
@@ -809,7 +2120,140 @@ class Group(Option):
 
     def __str__(self):
         return ', '.join([str(name) for name in self._names])
-            
+
+
+# ---------- constraint analysis ---------- #
+
+_Analysis = namedtuple('Analysis', 'redundant cycles unsatisfiable')
+
+
+def _is_plain(condition):
+    ''' Whether ``condition`` only tests that an argument is given. '''
+
+    return (type(condition) is Option and not condition._neg and
+            not condition._other_conditions)
+
+
+def _reachable(graph, start, skip=None):
+    ''' Names reachable from ``start`` in ``graph`` (name -> set of names)
+    without following the edge ``skip``. '''
+
+    seen = set()
+    stack = [start]
+    while stack:
+        node = stack.pop()
+        for succ in graph.get(node, ()):
+            if succ not in seen and (node, succ) != skip:
+                seen.add(succ)
+                stack.append(succ)
+
+    return seen
+
+
+def _analyze_constraints(requires, conflicts):
+    ''' Reduce the ``requires`` and ``conflicts`` dicts of a :class:`Parser`.
+    Returns an :class:`_Analysis` report with the reduced dicts, which map
+    the same keys to lists of conditions. '''
+
+    graph = {}
+    for arg, deps in iteritems(requires):
+        graph[arg.argname] = set(dep.argname for dep in deps if
+                _is_plain(dep))
+
+    # drop edges one at a time while the rest still imply them, which
+    # keeps reachability intact even within cycles
+    redundant = []
+    for name in sorted(graph):
+        for dep in sorted(graph[name]):
+            if dep == name or dep in _reachable(graph, name, (name, dep)):
+                graph[name].discard(dep)
+                redundant.append(('requires', name, dep))
+
+    closure = dict((name, _reachable(graph, name)) for name in graph)
+
+    cycles = set()
+    for name, reached in iteritems(closure):
+        cycle = [other for other in reached if name in
+                closure.get(other, ())]
+        if cycle:
+            cycles.add(tuple(sorted(set(cycle + [name]))))
+
+    reduced_requires = {}
+    for arg, deps in iteritems(requires):
+        kept = sorted((dep for dep in deps if _is_plain(dep) and dep.argname
+            in graph[arg.argname]), key=lambda dep: dep.argname)
+
+        # conditions may cast and compare values, so check them last
+        kept += [dep for dep in deps if not _is_plain(dep)]
+        if kept:
+            reduced_requires[arg] = kept
+
+    clashes = {}
+    reduced_conflicts = {}
+    for arg in sorted(conflicts, key=lambda arg: arg.argname):
+        kept = []
+        for conflict in sorted(conflicts[arg], key=str):
+            if not _is_plain(conflict):
+                kept.append(conflict)
+            elif arg.argname in clashes.get(conflict.argname, ()):
+                redundant.append(('conflicts', arg.argname, conflict.argname))
+            else:
+                clashes.setdefault(arg.argname, set()).add(conflict.argname)
+                clashes.setdefault(conflict.argname, set()).add(arg.argname)
+                kept.append(conflict)
+        if kept:
+            reduced_conflicts[arg] = kept
+
+    names = set(graph) | set(clashes)
+    unsatisfiable = []
+    for name in sorted(names):
+        scope = closure.get(name, set()) | set([name])
+        for other in sorted(scope):
+            clash = sorted(clashes.get(other, set()) & scope)
+            if clash:
+                unsatisfiable.append((name, other, clash[0]))
+                break
+
+    report = _Analysis(redundant, sorted(cycles), unsatisfiable)
+    return report, reduced_requires, reduced_conflicts
+
+def _fail(errors, error, *conditions):
+    ''' Raise ``error``, or append it to the list ``errors`` if collecting
+    them; ``conditions`` are the arguments/conditions involved. '''
+
+    names = set()
+    for condition in conditions:
+        names |= _condition_names(condition)
+    error.names = tuple(sorted(names))
+
+    if errors is None:
+        raise error
+    errors.append(error)
+
+
+def _condition_names(condition):
+    ''' Names of the arguments ``condition`` refers to. '''
+
+    names = set()
+    stack = [condition]
+    while stack:
+        item = stack.pop()
+        if not isinstance(item, Condition):
+            names.add(item)
+        elif isinstance(item, Group):
+            stack.extend(item._names)
+        else:
+            if isinstance(item, Option):
+                names.add(item.argname)
+            elif isinstance(item, _CallableCondition):
+                stack.extend(operand for operand in (item._main, item._other)
+                        if isinstance(operand, Option))
+            stack.extend(item._other_conditions)
+
+    return names
+
+# ---------- end constraint analysis ---------- #
+
 
 class Parser(object):
     ''' Command line parser. '''
@@ -845,6 +2289,50 @@ class Parser(object):
         # help message
         self._help_prefix = None
 
+        # (usage, help) text without program name, rendered on first use;
+        # and pager command, if use_pager is used
+        self._help = None
+        self._pager = None
+
+        # _LayeredConfig, if config_layers is used
+        self._layers = None
+
+        # prefix of environment variables, if environment is used, and
+        # (number of readers, normalized variable name -> argument name)
+        self._environ_prefix = None
+        self._environ_index = None
+
+        # return LazyResult instead of assigning to store
+        self._lazy = False
+
+        # return instance of result_type() instead of assigning to store
+        self._typed = False
+        self._result_class = None
+
+        # _ParseCache, if memoize is used, and (number of readers, whether
+        # any reader casts with side effects)
+        self._memo = None
+        self._side_effects = None
+
+        # accept unique prefixes of labels; (full name, shorthand) _Tries
+        self._abbreviate = False
+        self._tries = None
+
+        # _BKTree of labels, for suggestions on unknown labels
+        self._suggestions = None
+
+        # check reduced constraints, if analyze is used; and (report,
+        # requires, conflicts) from _analyze_constraints
+        self._analyzed = False
+        self._analysis = None
+
+        # reverse index from argument to constraints, for revalidate
+        self._constraint_index = None
+
+        # number of threads casting I/O-bound values, if concurrent_io is
+        # used
+        self._io_workers = None
+
         self._sys_exit_error = SystemExit
         self.out = sys.stdout # XXX not documented
 
@@ -868,6 +2356,7 @@ class Parser(object):
         function is triggered. '''
 
         self._help_prefix = message
+        self._help_changed()
         return self
 
     def underscore(self):
@@ -886,6 +2375,7 @@ class Parser(object):
                     'single_prefix cannot be superset of double_prefix')
 
         self._single_prefix = flag
+        self._definition_changed()
         return self
 
     def set_double_prefix(self, flag):
@@ -896,6 +2386,165 @@ class Parser(object):
             raise ValueError('single_flag cannot be superset of double_flag')
 
         self._double_prefix = flag
+        self._definition_changed()
+        return self
+
+    def environment(self, prefix=''):
+        '''
+
+        Pull values of all arguments from environment variables named
+        ``prefix`` followed by the argument name, in upper case and with '-'
+        replaced by '_'. For example:
+
+        ::
+
+            with Parser(locals()) as p:
+                p.int('port')
+                p.flag('dry-run')
+                p.environment('APP_')
+
+        Now the following are equivalent:
+
+        ::
+
+            python test.py --port 5000 --dry-run
+            APP_PORT=5000 APP_DRY_RUN=1 python test.py
+
+        Flags are set by the values 1, true, yes and on. ``os.environ`` is
+        scanned once per parse, and environment values are cast and checked
+        just like command line values. Values given on the command line or by
+        a :py:meth:`config` argument take precedence, while environment values
+        take precedence over :py:meth:`config_layers`.
+
+        '''
+
+        self._environ_prefix = prefix
+        return self
+
+    def lazy(self):
+        '''
+
+        Return a :class:`LazyResult` from parsing instead of assigning values
+        to the store. Values are cast on first access, so that arguments the
+        program does not use on a given run are never cast; for example, a
+        :py:meth:`directory` with ``create`` is only created when accessed.
+
+        ::
+
+            p = Parser().lazy()
+            p.int('workers')
+            p.directory('cache', create=True)
+            args = p.process_command_line()
+            print(args.workers)
+
+        Only the arguments involved in conditions are cast while verifying the
+        command line. A cast error surfaces as :class:`FormatError` when the
+        value is first accessed, or for all values at once via
+        :py:meth:`LazyResult.validate_all`.
+
+        '''
+
+        self._lazy = True
+        return self
+
+    def result_type(self):
+        '''
+
+        Return instances of a generated class from parsing, instead of
+        assigning values to the store. The class has one ``__slots__`` field
+        per argument (with '-' replaced by '_'), and is returned by this call:
+
+        ::
+
+            p = Parser()
+            p.int('workers')
+            p.flag('dry-run')
+            Args = p.result_type()
+
+            args = p.process_command_line()
+            print(args.workers, args.dry_run)
+
+        Instances are compact, support item access by field name, and can be
+        pickled, for example to send them to worker processes.
+
+        '''
+
+        self._typed = True
+        return self._get_result_class()
+
+    def _get_result_class(self):
+        if self._result_class is None:
+            self._result_class = _result_type(tuple(_field_name(name) for name
+                in self._options))
+
+        return self._result_class
+
+    def _make_result(self, assigned):
+        return self._get_result_class()(*[assigned.get(name) for name in
+            self._options])
+
+    def analyze(self):
+        '''
+
+        Analyze the constraints between arguments once, and check the
+        reduced constraints on every parse from now on. Requirements implied
+        by others (--a requires --c if --a requires --b and --b requires
+        --c) and conflicts given twice are dropped, and requirements on
+        arguments being given are checked before conditions on their values.
+        For example:
+
+        ::
+
+            p.int('c')
+            p.int('b').requires(p['c'])
+            p.int('a').requires(p['b'], p['c']).conflicts(p['c'])
+            p.analyze()
+
+        returns a report with the fields:
+
+        * ``redundant``: ``('requires' or 'conflicts', name, other)`` for each
+          dropped constraint, here ``[('requires', 'a', 'c')]``
+        * ``cycles``: tuples of names that require each other, directly or not
+        * ``unsatisfiable``: ``(name, other, conflicting)`` for each argument
+          that can never be given, because it (``other`` being it or one of
+          its requirements) requires an argument conflicting with ``other``;
+          here ``[('a', 'a', 'c')]``
+
+        '''
+
+        self._analyzed = True
+        self._constraint_index = None
+        return self._get_analysis()[0]
+
+    def concurrent_io(self, max_workers=8):
+        '''
+
+        Cast I/O-bound values, of :py:meth:`file` and :py:meth:`directory`
+        arguments, concurrently on up to ``max_workers`` threads. This helps
+        when many files are passed, e.g., to a :py:meth:`Option.multiple`
+        argument on a network filesystem. For example:
+
+        ::
+
+            p = Parser(locals()).concurrent_io(16)
+            p.file('inputs').multiple()
+
+        If casts fail, the error of the first failing argument, in the usual
+        order, is raised, and files already opened are closed.
+
+        '''
+
+        self._io_workers = max_workers
+        return self
+
+    def abbreviations(self):
+        ''' Accept unambiguous prefixes of argument labels. For example, with
+        arguments ``verbose`` and ``version``, ``--verb`` is accepted for
+        ``--verbose``, while ``--ver`` is rejected with an
+        :class:`AmbiguousArgumentError`. Exact labels always take precedence.
+        '''
+
+        self._abbreviate = True
         return self
 
     def use_aliases(self):
@@ -911,7 +2560,8 @@ class Parser(object):
 
 # --- types --- #
 
-    def config(self, name):
+    def config(self, name, snapshot_dir=None, declared_only=False,
+            sections=None):
         '''
         
         Add configuration file, whose key/value pairs will provide/replace any
@@ -952,9 +2602,57 @@ class Parser(object):
             config file, it must be indicated as allowing multiple (via
             :py:meth:`.multiple`).
 
+            Parsed config files are cached for the life of the process and
+            reused until the file's modification time, size or inode changes.
+            If ``snapshot_dir`` is given, each parse is also pickled into that
+            directory, so that later processes can skip INI parsing
+            altogether. Snapshots are unpickled, which can run arbitrary
+            code, so ``snapshot_dir`` must only be writable by trusted users;
+            snapshot files not owned by the current user, or writable by its
+            group or others, are ignored.
+
+            For very large config files, ``declared_only`` loads only the keys
+            that have been created as arguments of this parser: the file is
+            streamed a section at a time, and only matching keys are
+            interpolated. ``sections`` further restricts loading to the named
+            sections. As ``DEFAULT`` applies to every section wherever it is
+            in the file, the file is read twice: a quick pass for ``DEFAULT``,
+            then one for the other sections.
+
             '''
 
-        return self.str(name).cast(_ConfigCaster(self))
+        return self.str(name).cast(_ConfigCaster(self, snapshot_dir,
+            declared_only, sections))
+
+    def config_layers(self, *paths):
+        '''
+
+        Add layered configuration sources. Each path is either an INI file or a
+        directory, in which case all of its ``*.ini`` files are read in name
+        order. Later layers take precedence over earlier ones, and any value
+        given on the command line, or via a :py:meth:`config` argument, takes
+        precedence over all layers. Missing paths are ignored. For example:
+
+            ::
+
+                with Parser(locals()) as p:
+                    p.int('workers')
+                    p.config_layers('/etc/tool.ini', '/etc/tool/conf.d',
+                            os.path.expanduser('~/.tool.ini'))
+
+            Each layer is only re-read when one of its files changes, and the
+            merged view is kept between parses. Files of directory layers are
+            read in parallel threads.
+
+        '''
+
+        if self._layers is None:
+            self._layers = _LayeredConfig(self)
+
+        for path in paths:
+            self._layers.add(path)
+
+        return self
 
     def enum(self, name, values):
         arg = self.str(name)
@@ -962,6 +2660,7 @@ class Parser(object):
         for v in values[1:]:
             cond = cond.or_(arg == v)
 
+        arg._choices = tuple(values)
         return arg.requires(cond)
 
     def int(self, name):
@@ -1008,64 +2707,189 @@ class Parser(object):
 
         return self.multiword(name).cast(_RangeCaster())
 
-    def multiword(self, name):
-        ''' Accepts multiple terms as an argument. For example:
+    def multiword(self, name):
+        ''' Accepts multiple terms as an argument. For example:
+
+            ::
+
+                with Parser() as p:
+                    p.multiword('multi')
+
+            Now accepts:
+
+            ::
+
+               python test.py --multi path to something
+
+        '''
+
+        result = self._add_option(name)
+        self._set_reader(name, _MultiWordArgumentReader(self))
+        return result
+
+    def bool(self, name):
+        ''' Alias of :func:`flag`. '''
+
+        return self.flag(name)
+
+    def flag(self, name):
+        ''' Boolean value. The presence of this flag indicates a true value,
+        while an absence indicates false. No arguments. '''
+
+        result = self._add_option(name)
+        self._set_reader(name, _FlagArgumentReader(self))
+        return result
+
+    def file(self, name, mode=None, buffering=None):
+        ''' Opens the file indicated by the name passed by the user. ``mode``
+        and ``buffering`` are arguments passed to ``open``.
+
+        The example below implements a file copy operation:
+
+        ::
+
+            with Parser(locals()) as p:
+                p.file('input_file')
+                p.file('output_file', mode='w')
+                
+            output_file.write(input_file.read())
+
+        '''
+
+        return self.multiword(name).cast(_FileOpenerCaster(mode, buffering))
+
+    def directory(self, name, create=False):
+        ''' File directory value. Checks to ensure that the user passed file
+        name exists and is a directory (i.e., not some other file object). If
+        ``create`` is specified, creates the directory using ``os.makedirs``;
+        any intermediate directories are also created. '''
+
+        return self.multiword(name).cast(_DirectoryOpenerCaster(create))
+
+    def lines(self, name, encoding='utf-8', buffer_size=1 << 20):
+        '''
+
+        Iterable over the lines, without line endings, of the file named by
+        the user, or of stdin if the name is ``-``. The file is read in
+        chunks of ``buffer_size`` bytes, and decompressed if it is gzip,
+        bzip2, xz or (with the ``zstandard`` package) zstd data, as told by
+        its first bytes. Lines are decoded from ``encoding``, or are
+        ``bytes`` if it is ``None``. For example:
+
+        ::
+
+            with Parser(locals()) as p:
+                p.lines('input')
+
+            for line in input:
+                print(line)
+
+        The file is closed once iterated over, or by calling ``close``.
+
+        '''
+
+        return self.multiword(name).cast(_RecordsCaster('\n', encoding,
+            buffer_size, strip_cr=True))
+
+    def records(self, name, sep, encoding='utf-8', buffer_size=1 << 20):
+        ''' Like :py:meth:`lines`, but records are separated by ``sep`` (e.g.,
+        ``'\\0'`` for the output of ``find -print0``). '''
+
+        return self.multiword(name).cast(_RecordsCaster(sep, encoding,
+            buffer_size))
+
+    def output_file(self, name, mode='w', buffer_size=1 << 20, atomic=True):
+        '''
+
+        Output file, opened for writing with a buffer of ``buffer_size``
+        bytes. If ``atomic``, data is written to a temporary file in the same
+        directory, which replaces the file named by the user only once the
+        output file is closed, after syncing it to disk. If the ``with``
+        block of the output file exits with an error, or the file is still
+        open when the program exits, the temporary file is removed and the
+        named file is left untouched. For example:
+
+        ::
+
+            with Parser(locals()) as p:
+                p.output_file('output')
 
-            ::
+            with output:
+                for record in compute():
+                    output.write(record)
 
-                with Parser() as p:
-                    p.multiword('multi')
+        ``discard()`` drops the output explicitly.
 
-            Now accepts:
+        '''
 
-            ::
+        if atomic and ('a' in mode or '+' in mode):
+            raise ValueError('atomic output file cannot be opened with mode %s'
+                    % mode)
 
-               python test.py --multi path to something
+        return self.multiword(name).cast(_OutputFileCaster(mode, buffer_size,
+            atomic))
 
+    def tree(self, name, pattern='*', recursive=True, workers=1):
         '''
 
-        result = self._add_option(name)
-        self._set_reader(name, _MultiWordArgumentReader(self))
-        return result
+        Directory, like :py:meth:`directory`, whose value is an iterable over
+        the files under it whose names match the shell-style ``pattern``.
+        Files are yielded lazily as ``os.DirEntry`` objects, so that their
+        type and (on Windows) ``stat()`` come from listing the directory,
+        without further system calls. Subdirectories are walked only if
+        ``recursive``, and are listed by up to ``workers`` threads. For
+        example:
 
-    def bool(self, name):
-        ''' Alias of :func:`flag`. '''
+        ::
 
-        return self.flag(name)
+            with Parser(locals()) as p:
+                p.tree('logs', pattern='*.log', workers=8)
 
-    def flag(self, name):
-        ''' Boolean value. The presence of this flag indicates a true value,
-        while an absence indicates false. No arguments. '''
+            size = sum(entry.stat().st_size for entry in logs)
 
-        result = self._add_option(name)
-        self._set_reader(name, _FlagArgumentReader(self))
-        return result
+        Symbolic links to directories are not followed, and directories that
+        cannot be listed are skipped, as with ``os.walk``. The order of files
+        is that of a breadth-first walk.
 
-    def file(self, name, mode=None, buffering=None):
-        ''' Opens the file indicated by the name passed by the user. ``mode``
-        and ``buffering`` are arguments passed to ``open``.
+        '''
 
-        The example below implements a file copy operation:
+        if scandir is None:
+            raise RuntimeError('tree requires os.scandir or the scandir '
+                    'package')
+
+        return self.multiword(name).cast(_TreeCaster(pattern, recursive,
+            workers))
+
+    def glob(self, name):
+        '''
+
+        Shell-style pattern, for files too many to pass on the command line.
+        The value is a generator of the matching paths, found lazily with
+        ``os.scandir`` so that they can be processed while the pattern is
+        still being expanded. As with ``glob.glob``, ``**`` matches any
+        number of directories, and hidden files only match patterns starting
+        with '.'. If the argument is given several times with
+        :py:meth:`Option.multiple`, the value is a single generator over the
+        matches of all patterns, without duplicates. For example:
 
         ::
 
             with Parser(locals()) as p:
-                p.file('input_file')
-                p.file('output_file', mode='w')
-                
-            output_file.write(input_file.read())
+                p.glob('inputs').multiple()
 
-        '''
+            for path in inputs:
+                process(path)
 
-        return self.multiword(name).cast(_FileOpenerCaster(mode, buffering))
+        invoked with ``--inputs 'logs/**/*.log' --inputs 'extra/*.log'``.
+        Symbolic links to directories are not followed by ``**``.
 
-    def directory(self, name, create=False):
-        ''' File directory value. Checks to ensure that the user passed file
-        name exists and is a directory (i.e., not some other file object). If
-        ``create`` is specified, creates the directory using ``os.makedirs``;
-        any intermediate directories are also created. '''
+        '''
 
-        return self.multiword(name).cast(_DirectoryOpenerCaster(create))
+        if scandir is None:
+            raise RuntimeError('glob requires os.scandir or the scandir '
+                    'package')
+
+        return self.multiword(name).cast(_GlobCaster())
 
     def url(self, name):
         ''' URL value; verifies that argument has a scheme (e.g., http, ftp,
@@ -1138,10 +2962,12 @@ class Parser(object):
 
         # XXX [] allows redundancy?
         self._required.setdefault(arg, []).extend(newreplacements)
+        self._constraints_changed()
 
     @localize
     def _set_reader(self, name, option):
         self._readers[name] = option
+        self._help_changed()
 
     def _add_shorthand(self, source, alias):
         if source not in self._readers:
@@ -1152,6 +2978,7 @@ class Parser(object):
 
         self._alias[alias] = source
         self._source_to_alias[source] = alias
+        self._definition_changed()
 
     def _add_option(self, name):
         name = self._localize(name)
@@ -1163,8 +2990,76 @@ class Parser(object):
 
         o = Option(name, self)
         self._options[name] = o
+        self._definition_changed()
         return o
 
+    def _definition_changed(self):
+        ''' Drop everything precomputed from the set of arguments. '''
+
+        self._result_class = None
+        self._tries = None
+        self._suggestions = None
+        self._help = None
+        self._analysis = None
+        self._constraint_index = None
+
+    def _help_changed(self):
+        ''' Drop the rendered help message. '''
+
+        self._help = None
+
+    def _constraints_changed(self):
+        ''' Drop the analysis of constraints, and the help message showing
+        them. '''
+
+        self._analysis = None
+        self._constraint_index = None
+        self._help = None
+
+    def _expand_abbreviation(self, label, is_full):
+        ''' Return the :class:`Option` that ``label`` uniquely abbreviates,
+        or ``None``. '''
+
+        if self._tries is None:
+            self._tries = (_Trie(self._options), _Trie(self._alias))
+
+        if is_full:
+            candidates = self._tries[0].complete(label)
+            prefix = self._double_prefix
+        else:
+            candidates = self._tries[1].complete(label)
+            prefix = self._single_prefix
+
+        if len(candidates) > 1:
+            raise AmbiguousArgumentError(prefix + label, [prefix + candidate
+                for candidate in candidates])
+
+        if not candidates:
+            return None
+
+        if is_full:
+            return self._options.get(candidates[0])
+
+        return self._options.get(self._alias.get(candidates[0]))
+
+    def _suggest(self, label):
+        ''' Labels closest to the unknown ``label``, by edit distance. '''
+
+        if self._suggestions is None:
+            labels = [self._double_prefix + name for name in self._options]
+            labels += [self._single_prefix + alias for alias in self._alias]
+            self._suggestions = _BKTree(labels)
+
+        radius = min(3, max(1, len(label.lstrip(self._single_prefix +
+            self._double_prefix)) // 3))
+
+        # the tree needs a metric, where swapping two adjacent characters
+        # costs 2; rank by the distance where it costs 1
+        ranked = sorted((_transposition_distance(label, word), word) for
+                distance, word in self._suggestions.search(label, 2 * radius))
+
+        return [word for distance, word in ranked if distance <= radius][:3]
+
     def _getoption(self, option):
         o = self._readers.get(option, None)
         if o is not None:
@@ -1201,12 +3096,19 @@ class Parser(object):
         return new_args
 
     def _is_argument_label(self, arg):
-        return (arg.startswith(self._single_prefix) or
+        # a lone single prefix is a value, e.g. '-' for stdin
+        return arg != self._single_prefix and (
+                arg.startswith(self._single_prefix) or
                 arg.startswith(self._double_prefix))
 
-    def _parse(self, tokenized):
+    def _parse(self, tokenized, errors=None):
         current_reader = None
         parsed = Multidict()
+        # unlabeled tokens of this parse only, as the parser may be reused
+        self._extras = []
+
+        # after an unknown label, while collecting errors
+        skipping = False
 
         for arg in tokenized:
             if current_reader is not None:
@@ -1214,6 +3116,10 @@ class Parser(object):
                     continue
                 current_reader = None
 
+            if skipping and not self._is_argument_label(arg):
+                continue
+            skipping = False
+
             argument_name = None
 
             if self._is_argument_label(arg):
@@ -1227,6 +3133,7 @@ class Parser(object):
                 arg = arg[len(prefix):]
 
                 argument_name = self._localize(arg)
+                label = argument_name
 
                 if is_full:
                     argument_name = self._options.get(argument_name)
@@ -1234,6 +3141,9 @@ class Parser(object):
                     argument_name = self._options.get(
                             self._alias.get(argument_name))
 
+                if argument_name is None and self._abbreviate:
+                    argument_name = self._expand_abbreviation(label, is_full)
+
                 if argument_name is not None:
                     argument_name = argument_name.argname
 
@@ -1242,7 +3152,11 @@ class Parser(object):
                 if current_reader is None:
                     if argument_name is None:
                         argument_name = arg
-                    raise UnspecifiedArgumentError(argument_name)
+                    e = UnspecifiedArgumentError(argument_name)
+                    e.suggestions = self._suggest(prefix + label)
+                    _fail(errors, e, argument_name)
+                    skipping = True
+                    continue
 
                 current_reader = current_reader.fresh_copy()
                 current_reader.activate()
@@ -1264,7 +3178,8 @@ class Parser(object):
                 v = [v]
             for item in v:
                 if not item.is_specified():
-                    raise MissingValueError
+                    _fail(errors, MissingValueError(), k)
+                    break
 
         return parsed
 
@@ -1279,57 +3194,182 @@ class Parser(object):
             if isinstance(value, Caster) and isinstance(value._cast,
                     _ConfigCaster):  # XXX ugly
 
-                for k, v in value.getvalue():
+                # None if the config argument was not given
+                for k, v in value.getvalue() or ():
                     current_reader = pc.get(k)
 
                     if current_reader is None:
                         # developer didn't specify this argument
                         continue
 
-                    is_specified = current_reader.is_specified()
-                    if is_specified:
-                        current_reader = current_reader.fresh_copy()
+                    # bind to copies, so the parser's readers are left
+                    # untouched for subsequent parses
+                    if not _is_given(current_reader):
+                        pc.overwrite(k, self._bind(current_reader, v))
+                    else:
+                        if isinstance(current_reader, list):
+                            current_reader = current_reader[0]
+                        pc[k] = self._bind(current_reader, v)
 
-                    current_reader.consume_or_skip(v)
+                del pc[key]
 
-                    if is_specified:
-                        pc[k] = current_reader
+        if self._environ_prefix is not None:
+            self._bind_values(pc, self._environ_values())
 
-                del pc[key]
+        if self._layers is not None:
+            self._bind_values(pc, self._layers.view())
 
         return pc
 
-    def _assign(self, combined):
-        assigned = {}
-        for key, values in combined:
-            try:
-                if not self._options[key]._allows_multiple:
-                    value = values.getvalue()
-                else:
-                    if not isinstance(values, list):
-                        values = [values]
+    def _config_paths(self, combined):
+        ''' Paths of config files and config layers that values of a parse
+        of ``combined`` readers may come from. '''
+
+        paths = []
+        for key, value in combined:
+            for item in (value if isinstance(value, list) else [value]):
+                if isinstance(item, Caster) and isinstance(item._cast,
+                        _ConfigCaster):
+                    path = item._reader.getvalue()
+                    if path is not _ArgumentReader.UNSPECIFIED:
+                        paths.append(path)
+
+        if self._layers is not None:
+            paths.extend(layer.path for layer in self._layers._layers)
 
-                    value = [v.getvalue() for v in values]
+        return paths
 
-                if value is _ArgumentReader.UNSPECIFIED:
-                    value = None
+    def _bind_values(self, pc, values):
+        ''' Bind ``values`` to the readers of ``pc`` that are not yet given.
+        '''
+
+        for key, value in iteritems(values):
+            current_reader = pc.get(key)
+            if current_reader is None or _is_given(current_reader):
+                continue
+
+            pc.overwrite(key, self._bind(current_reader, value))
+
+    def _environ_values(self):
+        ''' Scan ``os.environ`` once for variables bound to arguments via
+        :py:meth:`environment`. '''
+
+        if self._environ_index is None or \
+                self._environ_index[0] != len(self._readers):
+            index = dict((name.upper().replace('-', '_'), name) for name in
+                    self._readers)
+            self._environ_index = (len(self._readers), index)
+
+        index = self._environ_index[1]
+        prefix = self._environ_prefix
+        length = len(prefix)
+
+        values = {}
+        for key, value in iteritems(os.environ):
+            if key.startswith(prefix):
+                name = index.get(key[length:].upper())
+                if name is not None:
+                    values[name] = value
+
+        return values
 
-                assigned[key] = value
+    def _bind(self, reader, value):
+        ''' Return a fresh copy of ``reader`` that has consumed ``value``, as
+        if it was passed on the command line. '''
 
-            except MissingValueError:
-                raise MissingValueError('%s specified but missing given value'
-                        % key)
+        reader = reader.fresh_copy()
+        if _is_flag(reader):
+            if value.strip().lower() in _TRUE_STRINGS:
+                reader.activate()
+        else:
+            reader.consume_or_skip(value)
+
+        return reader
+
+    def _assign(self, combined, keys=None):
+        items = [(key, values) for key, values in combined if keys is None or
+                key in keys]
+
+        cast = None
+        if self._io_workers is not None:
+            readers = []
+            for key, values in items:
+                if not isinstance(values, list):
+                    values = [values]
+                readers.extend(reader for reader in values if
+                        _does_io(reader))
+
+            cast = _Prefetched(readers, self._io_workers)
+
+        assigned = {}
+        try:
+            for key, values in items:
+                assigned[key] = self._cast(key, values, cast)
+        except Exception:
+            # close files opened before the failing cast
+            opened = []
+            for key, values in items:
+                if key in assigned and _has_side_effects(values if not
+                        isinstance(values, list) else values[0]):
+                    value = assigned[key]
+                    opened.extend(value if isinstance(value, list) else
+                            [value])
+            if cast is not None:
+                opened.extend(cast.values())
+
+            _close_values(opened)
+            raise
 
         return assigned
 
-    def _check_multiple(self, assigned):
+    def _cast(self, key, values, cast=None):
+        ''' Value of argument ``key`` from its reader(s) ``values``, each
+        cast by ``cast`` (by default, its ``getvalue``). '''
+
+        if cast is None:
+            cast = _getvalue
+
+        try:
+            if not self._options[key]._allows_multiple:
+                value = cast(values)
+            else:
+                if not isinstance(values, list):
+                    values = [values]
+
+                value = []
+                try:
+                    for reader in values:
+                        value.append(cast(reader))
+                except Exception:
+                    # close files opened before the failing one
+                    if _has_side_effects(values[0]):
+                        _close_values(value)
+                    raise
+
+            if value is _ArgumentReader.UNSPECIFIED:
+                value = None
+
+            merge = _merge_hook(values)
+            if merge is not None and value is not None:
+                value = merge(value if isinstance(value, list) else [value])
+
+            return value
+
+        except MissingValueError:
+            raise MissingValueError('%s specified but missing given value'
+                    % key)
+
+    def _check_multiple(self, assigned, errors=None):
         for key, values in assigned:
             if isinstance(values, list) and not self._options[key]._allows_multiple:
-                raise MultipleSpecifiedArgumentError(('%s specified multiple' +
-                    ' times') % self._options[key])
+                _fail(errors, MultipleSpecifiedArgumentError(('%s specified' +
+                    ' multiple times') % self._options[key]), key)
 
-    def _check_required(self, assigned):
-        for arg, replacements in iteritems(self._required):
+    def _check_required(self, assigned, required=None, errors=None):
+        if required is None:
+            required = self._required
+
+        for arg, replacements in iteritems(required):
             missing = []
             if not arg._is_satisfied(assigned):
                 for v in replacements:
@@ -1342,35 +3382,101 @@ class Parser(object):
                         break
                 else:
                     if missing:
-                        raise ManyAllowedNoneSpecifiedArgumentError([arg] +
-                                missing)
+                        _fail(errors, ManyAllowedNoneSpecifiedArgumentError(
+                            [arg] + missing), arg, *missing)
                     else:
-                        raise MissingRequiredArgumentError(arg)
+                        _fail(errors, MissingRequiredArgumentError(arg), arg)
+
+    def _get_analysis(self):
+        if self._analysis is None:
+            self._analysis = _analyze_constraints(self._requires,
+                    self._conflicts)
+        return self._analysis
+
+    def _constraints(self):
+        ''' The requires and conflicts dicts to check when parsing. '''
+
+        if not self._analyzed:
+            return self._requires, self._conflicts
 
-    def _check_dependencies(self, assigned):
-        for arg, deps in iteritems(self._requires):
+        return self._get_analysis()[1:]
+
+    def _check_dependencies(self, assigned, requires=None, errors=None):
+        if requires is None:
+            requires = self._constraints()[0]
+
+        for arg, deps in iteritems(requires):
             if arg._is_satisfied(assigned):
                 for v in deps:
                     if not v._is_satisfied(assigned):
                         if isinstance(v, _CallableCondition):
-                            raise ConditionError(arg.argname, v)
-                        raise DependencyError(arg, v)
+                            error = ConditionError(arg.argname, v)
+                        else:
+                            error = DependencyError(arg, v)
+                        _fail(errors, error, arg, v)
 
-    def _check_conflicts(self, assigned):
-        for arg, conflicts in iteritems(self._conflicts):
+    def _check_conflicts(self, assigned, table=None, errors=None):
+        if table is None:
+            table = self._constraints()[1]
+
+        for arg, conflicts in iteritems(table):
             if arg._is_satisfied(assigned):
                 for conflict in conflicts:
                     if conflict._is_satisfied(assigned):
-                        raise ConflictError(arg.argname, conflict.argname)
-
-    def _verify(self, assigned):
-        self._check_required(assigned)
-        self._check_dependencies(assigned)
-        self._check_conflicts(assigned)
+                        _fail(errors, ConflictError(arg.argname,
+                            conflict.argname), arg, conflict)
+
+    def _verify(self, assigned, names=None):
+        ''' Check constraints on ``assigned``; only those mentioning
+        ``names``, if given. '''
+
+        if names is None:
+            self._check_required(assigned)
+            self._check_dependencies(assigned)
+            self._check_conflicts(assigned)
+            return
+
+        index, tables = self._get_constraint_index()
+        subsets = ({}, {}, {})
+        for name in names:
+            for kind, argname in index.get(name, ()):
+                key, value = tables[kind][argname]
+                subsets[kind][key] = value
+
+        self._check_required(assigned, subsets[0])
+        self._check_dependencies(assigned, subsets[1])
+        self._check_conflicts(assigned, subsets[2])
+
+    def _get_constraint_index(self):
+        ''' Return argument name -> set of (kind, name of constrained
+        argument) for the constraints mentioning it, and per kind
+        (required, requires, conflicts) name -> (key, constraints). '''
+
+        if self._constraint_index is None:
+            index = {}
+            tables = ({}, {}, {})
+            for kind, table in enumerate((self._required,) +
+                    tuple(self._constraints())):
+                for key, constraints in iteritems(table):
+                    tables[kind][key.argname] = (key, constraints)
+
+                    names = set([key.argname])
+                    for constraint in constraints:
+                        names |= _condition_names(constraint)
+
+                    for name in names:
+                        index.setdefault(name, set()).add((kind, key.argname))
+
+            self._constraint_index = (index, tables)
+
+        return self._constraint_index
+
+    def _assign_to_store(self, assigned, store=None):
+        if store is None:
+            store = self._store
 
-    def _assign_to_store(self, assigned):
         for key, value in iteritems(assigned):
-            self._store[key] = value
+            store[key] = value
 
     @_options_to_names
     def _set_one_required(self, *names):
@@ -1384,35 +3490,444 @@ class Parser(object):
         if not isinstance(args, list):
             raise TypeError('%s not list' % args)
 
-        return args
+        return args
+
+    def _combine_with_defaults(self, user_args):
+        copy = Multidict(self._readers.copy())
+
+        for k, v in user_args:
+            copy.overwrite(k, v)
+
+        return copy
+
+    def _command_line_readers(self, args=None):
+        ''' Readers of the command line ``args``, combined with defaults. '''
+
+        args = self._get_args(args)
+        tokenized = self._tokenize(args)
+        user_args = self._parse(tokenized)
+        self._help_if_necessary(user_args)
+        return self._combine_with_defaults(user_args)
+
+    def _resolve(self, combined):
+        ''' Apply config values to the ``combined`` readers and verify the
+        result. '''
+
+        user_args = self._config_values(combined)
+        self._check_multiple(user_args)
+        self._verify(user_args)
+        return user_args
+
+    def _process_command_line(self, args=None, store=None):
+        try:
+            args = self._get_args(args)
+
+            key = self._memo_key(args)
+            if key is not None:
+                assigned = self._memo.get(key)
+                if assigned is not None:
+                    return self._finish(assigned, store)
+
+            base = self._command_line_readers(args)
+            if key is not None:
+                # taken before reading, so later changes invalidate the entry
+                state = _ParseCache.state(self._config_paths(base))
+
+            user_args = self._resolve(base)
+
+            if self._lazy:
+                return LazyResult(self, user_args)
+
+            assigned = self._assign(user_args)
+            if key is not None:
+                self._memo.put(key, assigned, state)
+        except ArgumentError as e:
+            raise e
+
+#        self._init_user_set()  # reset
+
+        return self._finish(assigned, store)
+
+    def _finish(self, assigned, store=None):
+        if self._typed:
+            return self._make_result(assigned)
+
+        if store is None:
+            store = self._store
+
+        self._assign_to_store(assigned, store)
+        return store
+
+    def validate(self, args=None):
+        '''
+
+        Check ``args`` (by default, the command line) in one pass, and return
+        the list of every :class:`ArgumentError` found, empty if ``args`` are
+        valid. ``names`` of each error lists the arguments involved. Values
+        are not assigned to the store, and ``help`` is ignored. For example:
+
+        ::
+
+            for error in p.validate(['--workers', 'many', '--bogus']):
+                print(error.names, error)
+
+        Constraints are not checked on arguments with errors of their own,
+        such as values failing to cast. Casts with side effects are not run:
+        files are not opened or created, only checked for existence, so
+        that validation leaves the filesystem untouched.
+
+        '''
+
+        errors = []
+        parsed = self._parse(self._tokenize(self._get_args(args)), errors)
+        combined = self._config_values(self._combine_with_defaults(parsed))
+        self._check_multiple(combined, errors)
+
+        failed = set()
+        for error in errors:
+            failed.update(error.names)
+
+        for key, values in combined:
+            if key in failed:
+                continue
+
+            try:
+                value = self._cast(key, values, _checked)
+            except ArgumentError as e:
+                failed.add(key)
+                _fail(errors, e, key)
+            else:
+                _close_values(value if isinstance(value, list) else [value])
+
+        subsets = (None, None, None)
+        if failed:
+            index, tables = self._get_constraint_index()
+            skip = set()
+            for name in failed:
+                skip |= index.get(name, set())
+
+            subsets = tuple(dict(value for argname, value in iteritems(table)
+                if (kind, argname) not in skip) for kind, table in
+                enumerate(tables))
+
+        self._check_required(combined, subsets[0], errors)
+        self._check_dependencies(combined, subsets[1], errors)
+        self._check_conflicts(combined, subsets[2], errors)
+        return errors
+
+    def parse_state(self, args=None):
+        '''
+
+        Parse ``args`` (by default, the command line) into a
+        :class:`ParseState`, to be changed cheaply by :py:meth:`revalidate`.
+        Values are not assigned to the store.
+
+        '''
+
+        args = self._get_args(args)
+        user_args = self._resolve(self._command_line_readers(args))
+        return ParseState(user_args, self._assign(user_args))
+
+    def revalidate(self, state, delta):
+        '''
+
+        Return a new :class:`ParseState` from ``state`` with the values of
+        ``delta``, a dict of argument name -> value as passed on the command
+        line (or a list of them, for arguments allowing multiple values).
+        ``None`` resets an argument to its default. Only the changed
+        arguments are cast, and only the constraints mentioning them are
+        checked. For example:
+
+        ::
+
+            base = p.parse_state(['--workers', '4', '--host', 'a'])
+            for workers in (8, 16, 32):
+                run(p.revalidate(base, {'workers': workers}).values)
+
+        '''
+
+        readers = state._readers.copy()
+        for name, value in iteritems(delta):
+            reader = self._readers.get(name)
+            if reader is None:
+                raise UnspecifiedArgumentError(name)
+
+            if value is None:
+                # the parser's own readers hold only defaults
+                readers.overwrite(name, reader)
+            elif isinstance(value, (list, tuple)):
+                readers.overwrite(name, [self._bind(reader, str(item)) for
+                    item in value])
+            else:
+                readers.overwrite(name, self._bind(reader, str(value)))
+
+        changed = [(name, readers.get(name)) for name in delta]
+        self._check_multiple(changed)
+        self._verify(readers, delta)
+
+        assigned = dict(state.values)
+        assigned.update(self._assign(changed))
+        return ParseState(readers, assigned)
+
+    def parse_async(self, args=None, store=None):
+        '''
+
+        Parse ``args`` (by default, the command line) on the running
+        ``asyncio`` event loop, returning a future of the result. Casts may
+        be coroutine functions; they are awaited concurrently, and other
+        casts and constraint checks run on the loop once they are all done.
+        For example:
+
+        ::
+
+            async def known_user(name):
+                if not await db.has_user(name):
+                    raise FormatError('%s: no such user' % name)
+                return name
+
+            p = Parser()
+            p.str('user').cast(known_user)
+            args = await p.parse_async(['--user', 'alice'])
+
+        A coroutine cast must be the last cast of its argument. Values are
+        assigned to ``store`` (by default, the store of this parser), which
+        is the result, unless :py:meth:`result_type` is used. Errors are raised
+        as :class:`ArgumentError` rather than exiting, values are cast even
+        if :py:meth:`lazy` is used, and results are not memoized. If
+        ``--help`` is given, the help message is printed and the result is
+        ``None``.
+
+        '''
+
+        try:
+            import asyncio
+        except ImportError:
+            raise RuntimeError('parse_async requires asyncio')
+
+        loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)()
+        future = loop.create_future()
+
+        pending = []
+        awaitables = []
+        try:
+            combined = self._config_values(self._command_line_readers(args))
+            self._check_multiple(combined)
+
+            for key, values in combined:
+                for i, reader in enumerate(values if isinstance(values, list)
+                        else [values]):
+                    if _is_async(reader):
+                        value = reader.getvalue()
+                        if asyncio.iscoroutine(value):
+                            pending.append((key, i, reader))
+                            awaitables.append(value)
+        except self._sys_exit_error:
+            # help was printed
+            future.set_result(None)
+            return future
+        except Exception as e:
+            for awaitable in awaitables:
+                awaitable.close()
+            future.set_exception(e)
+            return future
+
+        gathered = asyncio.gather(*awaitables, return_exceptions=True)
+
+        def finish(gathered):
+            if future.cancelled():
+                return
+
+            try:
+                results = gathered.result()
+                for (key, i, reader), result in zip(pending, results):
+                    if isinstance(result, ValueError) and not isinstance(
+                            result, ArgumentError):
+                        raise FormatError(str(result))
+                    if isinstance(result, BaseException):
+                        raise result
+
+                    awaited = _Awaited(reader, result)
+                    values = combined.get(key)
+                    if isinstance(values, list):
+                        values[i] = awaited
+                    else:
+                        combined.overwrite(key, awaited)
+
+                self._verify(combined)
+                result = self._finish(self._assign(combined), store)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+        def cancel(future):
+            if future.cancelled():
+                gathered.cancel()
+
+        gathered.add_done_callback(finish)
+        future.add_done_callback(cancel)
+        return future
+
+    def parse_line(self, line):
+        '''
+
+        Parse ``line`` as a command line, tokenized like the shell does
+        (see ``shlex.split``), and return its values. Unlike
+        :py:meth:`process_command_line`, values are returned in a new
+        ``dict`` rather than assigned to the store, and errors are raised as
+        :class:`ArgumentError` rather than exiting. If ``--help`` is given, the
+        help message is printed and ``None`` returned. This allows a single
+        parser to be reused for many commands:
+
+        ::
+
+            p = Parser()
+            p.str('user').required()
+            p.flag('admin')
+
+            values = p.parse_line('--user "Ann Smith" --admin')
+
+        '''
+
+        try:
+            args = _split_line(line)
+        except ValueError as e:
+            raise FormatError(str(e))
+
+        try:
+            return self._process_command_line(args, {})
+        except self._sys_exit_error:
+            # help was printed
+            return None
+
+    def repl(self, stream=None):
+        ''' Parse each line of ``stream`` (by default ``sys.stdin``) via
+        :py:meth:`parse_line`, yielding its values, or the
+        :class:`ArgumentError` if the line was rejected. Blank lines are
+        skipped. '''
+
+        if stream is None:
+            stream = sys.stdin
+
+        for line in stream:
+            if not line.strip():
+                continue
+
+            try:
+                yield self.parse_line(line)
+            except ArgumentError as e:
+                yield e
+
+    def _memo_key(self, args):
+        if self._memo is None or self._lazy:
+            return None
+
+        if self._side_effects is None or \
+                self._side_effects[0] != len(self._readers):
+            self._side_effects = (len(self._readers), any(_has_side_effects(
+                reader) for reader in self._readers.values()))
+
+        if self._side_effects[1]:
+            return None
+
+        environ = None
+        if self._environ_prefix is not None:
+            environ = tuple(sorted((k, v) for k, v in iteritems(os.environ)
+                if k.startswith(self._environ_prefix)))
+
+        return tuple(args), environ
+
+    def memoize(self, maxsize=128):
+        '''
+
+        Cache results of parsing by command line, keeping the ``maxsize`` most
+        recently used. This pays off when the same command lines are parsed
+        over and over by a long-lived parser:
+
+        ::
+
+            p = Parser().memoize(maxsize=512)
+            p.int('count')
+            for line in commands:
+                values = p.process_command_line(line.split())
+
+        Cached results are invalidated when config files they were read from
+        change, and keyed by the environment if :py:meth:`environment` is
+        used. Parsers with arguments whose casts have side effects, such as
+        :py:meth:`file` or :py:meth:`directory` with ``create``, are never
+        cached, and neither are :py:meth:`lazy` results. Hit and miss counts
+        are available via :py:meth:`cache_info`.
+
+        '''
+
+        self._memo = _ParseCache(maxsize)
+        return self
+
+    def cache_info(self):
+        ''' Return ``(hits, misses, maxsize, currsize)`` of the
+        :py:meth:`memoize` cache, or ``None`` if it is not used. '''
+
+        if self._memo is None:
+            return None
+
+        return self._memo.info()
+
+    def watch(self, args=None, interval=1.0, on_error=None):
+        '''
+
+        Parse ``args`` (by default ``sys.argv``) and return a
+        :class:`ConfigWatcher` that reloads the values whenever a config file
+        given to a :py:meth:`config` argument, or a :py:meth:`config_layers`
+        source, changes. This is meant for long-running processes:
+
+        ::
+
+            p = Parser()
+            p.int('workers').default(4)
+            p.config('conf')
+
+            watcher = p.watch()
+            watcher.subscribe(lambda values, diff: pool.resize(values['workers']))
+            watcher.start()
+
+        Reloads are validated like a regular parse; if a reload fails, the
+        previous values are kept and ``on_error`` (if given) is called with
+        the :class:`ArgumentError`.
+
+        '''
+
+        return ConfigWatcher(self, args, interval, on_error)
+
+    def serve(self, path, main):
+        '''
+
+        Serve invocations of ``main`` over the Unix domain socket at ``path``
+        (see :class:`Server`), so that a heavy program is imported and its
+        parser built only once:
 
-    def _combine_with_defaults(self, user_args):
-        copy = Multidict(self._readers.copy())
+        ::
 
-        for k, v in user_args:
-            copy.overwrite(k, v)
+            p = Parser()
+            p.int('count')
+            p.serve('/tmp/tool.sock', main)
 
-        return copy
+        while invocations are run with:
 
-    def _process_command_line(self, args=None):
-        try:
-            args = self._get_args(args)
-            tokenized = self._tokenize(args)
-            user_args = self._parse(tokenized)
-            self._help_if_necessary(user_args)
-            user_args = self._combine_with_defaults(user_args)
-            user_args = self._config_values(user_args)
-            self._check_multiple(user_args)
-            self._verify(user_args)
+        ::
 
-            assigned = self._assign(user_args)
-            self._assign_to_store(assigned)
-        except ArgumentError as e:
-            raise e
+            python -m blargs /tmp/tool.sock --count 3
 
-#        self._init_user_set()  # reset
+        Each invocation is parsed and run in a forked child, with values passed
+        to ``main``.
+
+        '''
 
-        return self._store
+        server = Server(path, self, main)
+        _freeze()
+        try:
+            server.serve_forever()
+        finally:
+            server.close()
 
     def _emit(self, *args):
         print(*args, file=self.out)
@@ -1444,28 +3959,23 @@ class Parser(object):
             self.bail(e)
 
     def _usage(self):
-        return ('Usage: %s ' % sys.argv[0]) + ' '.join('[%s]' %
-                self._label(value) for value in self._options.values())
+        return ('Usage: %s ' % sys.argv[0]) + self._render_help()[0]
 
-    def _print_table(self, t):
+    def _format_table(self, t):
         # XXX what about empty list?
-        column_max_lengths = [len(x) for x in t[0]]
-
-        for row in t[1:]:
-            column_max_lengths = [max(column_max_lengths[i], len(column)) for i, column
-                    in enumerate(row)]
+        column_max_lengths = [max(len(row[i]) for row in t) for i in
+                range(len(t[0]))]
 
-        for row in t:
-            line = ''
-            for i, column in enumerate(row):
-                fmt = '   %-' + str(column_max_lengths[i]) + 's'
-                line += fmt
+        fmt = ''.join('   %-' + str(length) + 's' for length in
+                column_max_lengths)
 
-            self._emit(line % row)
+        return [fmt % row for row in t]
 
     def bail(self, e):
         msg = []
         msg.append('Error: ' + str(e))
+        if getattr(e, 'suggestions', None):
+            msg.append('Did you mean %s?' % ' or '.join(e.suggestions))
         msg.append(self._usage())
 
         self._emit('\n'.join(msg))
@@ -1483,12 +3993,14 @@ class Parser(object):
     @_names_to_options
     def _set_requires(self, a, b):
         self._requires.setdefault(a, set()).add(b)
+        self._constraints_changed()
 
     @_localize_all
     @_verify_args_exist
     @_names_to_options
     def _set_conflicts(self, a, b):
         self._conflicts.setdefault(a, set()).add(b)
+        self._constraints_changed()
 
     def __enter__(self):
         return self
@@ -1526,14 +4038,31 @@ class Parser(object):
 
         return pkey
 
-    def print_help(self):
-        self._emit(self._usage())
+    def use_pager(self, command=None):
+        ''' Page the help message through ``command`` when it is printed to a
+        terminal. By default, the ``PAGER`` environment variable, or ``less``,
+        is used. '''
+
+        self._pager = command or ''
+        return self
+
+    def _render_help(self):
+        ''' Return usage (without program name) and help text, rendered once
+        per definition of this parser. '''
+
+        if self._help is not None:
+            return self._help
+
+        usage = ' '.join('[%s]' % self._label(value) for value in
+                self._options.values())
 
+        lines = []
         if self._help_prefix:
-            self._emit(self._help_prefix)
+            lines.append(self._help_prefix)
 
-        self._emit('Options: (! denotes required argument)')
-        column_width = -1
+        lines.append('Options: (! denotes required argument)')
+
+        required = set(opt.argname for opt in self._required)
 
         labels = []
         for key, opt in iteritems(self._options):
@@ -1542,7 +4071,7 @@ class Parser(object):
             if opt._description is not None:
                 desc = opt._description
 
-            if opt._isrequired():
+            if key in required:
                 name = '!' + name
 
             conflict_str = ''
@@ -1558,8 +4087,850 @@ class Parser(object):
 
             labels.append((name, desc, conflict_str, requirement_str))
 
-        self._print_table(labels)
+        lines += self._format_table(labels)
+        lines.append('')
+
+        self._help = (usage, '\n'.join(lines))
+        return self._help
+
+    def _page(self, text):
+        ''' Show ``text`` in the pager; return whether that worked. '''
+
+        import subprocess
+
+        command = self._pager or os.environ.get('PAGER') or 'less'
+        encoding = getattr(self.out, 'encoding', None) or 'utf-8'
+        try:
+            pager = subprocess.Popen(command, shell=True,
+                    stdin=subprocess.PIPE)
+            pager.communicate(text.encode(encoding))
+        except (IOError, OSError):
+            return False
+
+        # 127: command not found
+        return pager.returncode != 127
+
+    def print_help(self):
+        ''' Print the help message with a single write to ``out``, or through
+        the pager if :py:meth:`use_pager` was called. '''
+
+        text = self._usage() + '\n' + self._render_help()[1]
+
+        isatty = getattr(self.out, 'isatty', None)
+        if self._pager is not None and isatty and isatty():
+            if self._page(text):
+                return
+
+        self.out.write(text)
+
+    def _completion_index(self):
+        index = []
+        for name in sorted(self._options):
+            opt = self._options[name]
+            alias = opt._alias()
+            index.append(_CompletionEntry(self._double_prefix + name,
+                alias and self._single_prefix + alias,
+                _completion_kind(self._readers[name]), opt._choices,
+                opt._description or '', opt._allows_multiple))
+        return index
+
+    def completion(self, shell, prog=None):
+        '''
+
+        Return a completion script for ``shell`` ('bash', 'zsh' or 'fish').
+        All labels, which of them take values, and the values of enums are
+        written into the script, so completing never runs the program.
+        Values of file and directory arguments are completed by the shell
+        itself. For example:
+
+        ::
+
+            python myprog.py --help  # once, with a hook calling:
+            open('myprog.bash', 'w').write(p.completion('bash', 'myprog'))
+
+        :param shell: name of the shell
+        :param prog: command to complete, defaults to basename of
+            ``sys.argv[0]``
+
+        '''
+
+        try:
+            generate = _COMPLETION_SCRIPTS[shell]
+        except KeyError:
+            raise ValueError('no completion for shell %s' % shell)
+
+        if prog is None:
+            prog = os.path.basename(sys.argv[0])
+
+        return generate(self, prog, self._completion_index())
+
+
+# ---------- shell completion ---------- #
+
+_CompletionEntry = namedtuple('_CompletionEntry',
+        'label alias kind choices description multiple')
+
+
+def _shell_quote(value):
+    return "'%s'" % str(value).replace("'", "'\\''")
+
+
+def _bash_completion(parser, prog, index):
+    function = '_%s_completion' % re.sub(r'\W', '_', prog)
+    lines = [function + '() {',
+             '    local cur="${COMP_WORDS[COMP_CWORD]}"',
+             '    local prev="${COMP_WORDS[COMP_CWORD-1]}"',
+             '    case "$prev" in']
+
+    for entry in index:
+        if entry.kind == 'flag':
+            continue
+
+        pattern = '|'.join(_shell_quote(label) for label in
+                (entry.label, entry.alias) if label)
+        if entry.kind == 'file':
+            action = 'COMPREPLY=($(compgen -f -- "$cur"))'
+        elif entry.kind == 'directory':
+            action = 'COMPREPLY=($(compgen -d -- "$cur"))'
+        elif entry.choices:
+            action = 'COMPREPLY=($(compgen -W %s -- "$cur"))' % _shell_quote(
+                    ' '.join(str(c) for c in entry.choices))
+        else:
+            action = 'COMPREPLY=()'
+        lines.append('        %s) %s; return;;' % (pattern, action))
+
+    labels = []
+    for entry in index:
+        labels.append(entry.label)
+        if entry.alias:
+            labels.append(entry.alias)
+
+    lines += ['    esac',
+              '    COMPREPLY=($(compgen -W %s -- "$cur"))' % _shell_quote(
+                  ' '.join(labels)),
+              '}',
+              'complete -o filenames -F %s %s' % (function, _shell_quote(prog)),
+              '']
+    return '\n'.join(lines)
+
+
+def _zsh_escape(text):
+    return (text.replace('\\', '\\\\').replace("'", "'\\''")
+            .replace('[', '\\[').replace(']', '\\]').replace(':', '\\:'))
+
+
+def _zsh_completion(parser, prog, index):
+    lines = ['#compdef %s' % prog, '_arguments \\']
+
+    for entry in index:
+        if entry.kind == 'flag':
+            action = ''
+        elif entry.kind == 'file':
+            action = ':file:_files'
+        elif entry.kind == 'directory':
+            action = ':directory:_files -/'
+        elif entry.choices:
+            action = ':value:(%s)' % ' '.join(_zsh_escape(str(c)) for c in
+                    entry.choices)
+        else:
+            action = ':value: '
+
+        if entry.description:
+            action = '[%s]%s' % (_zsh_escape(entry.description), action)
+        repeat = '*' if entry.multiple else ''
+        for label in (entry.label, entry.alias):
+            if label:
+                lines.append("    '%s%s%s' \\" % (repeat, _zsh_escape(label),
+                    action))
+
+    lines[-1] = lines[-1][:-2]
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def _fish_completion(parser, prog, index):
+    if parser._double_prefix != '--' or parser._single_prefix != '-':
+        raise ValueError('fish completion requires the - and -- prefixes')
+
+    lines = []
+    for entry in index:
+        line = 'complete -c %s -l %s' % (_shell_quote(prog), entry.label[2:])
+        if entry.alias:
+            if len(entry.alias) == 2:
+                line += ' -s %s' % entry.alias[1:]
+            else:
+                line += ' -o %s' % entry.alias[1:]
+
+        if entry.kind == 'file':
+            line += ' -r -F'
+        elif entry.kind == 'directory':
+            line += " -x -a '(__fish_complete_directories)'"
+        elif entry.choices:
+            line += ' -x -a %s' % _shell_quote(' '.join(str(c) for c in
+                entry.choices))
+        elif entry.kind == 'value':
+            line += ' -x'
+
+        if entry.description:
+            line += ' -d %s' % _shell_quote(entry.description)
+        lines.append(line)
+
+    lines.append('')
+    return '\n'.join(lines)
+
+
+_COMPLETION_SCRIPTS = {'bash': _bash_completion, 'zsh': _zsh_completion,
+        'fish': _fish_completion}
+
+# ---------- end shell completion ---------- #
+
+
+_IDENTIFIER_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def _field_name(name):
+    field = name.replace('-', '_')
+    if not _IDENTIFIER_RE.match(field):
+        raise ValueError('%s cannot be a result field' % name)
+    return field
+
+
+class _Result(object):
+    ''' Base of classes generated by :py:meth:`Parser.result_type`. '''
+
+    __slots__ = ()
+    _fields = ()
+
+    def __init__(self, *values):
+        for field, value in zip(self._fields, values):
+            setattr(self, field, value)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, _field_name(key))
+        except (AttributeError, ValueError):
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key.replace('-', '_') in self._fields
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __eq__(self, other):
+        return (type(self) is type(other) and
+                self._astuple() == other._astuple())
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def _astuple(self):
+        return tuple(getattr(self, field) for field in self._fields)
+
+    def _asdict(self):
+        return dict(zip(self._fields, self._astuple()))
+
+    def __reduce__(self):
+        return (_make_result, (self._fields, self._astuple()))
+
+    def __repr__(self):
+        return 'Result(%s)' % ', '.join('%s=%r' % (field, getattr(self,
+            field)) for field in self._fields)
+
+
+# generated result classes by field names; shared so that pickled results
+# can be restored in any process
+_result_types = {}
+
+
+def _result_type(fields):
+    cls = _result_types.get(fields)
+    if cls is None:
+        cls = type('Result', (_Result,), {'__slots__': fields,
+            '_fields': fields})
+        _result_types[fields] = cls
+
+    return cls
+
+
+def _make_result(fields, values):
+    return _result_type(fields)(*values)
+
+
+class LazyResult(object):
+    ''' Result of parsing with :py:meth:`Parser.lazy`. Values are accessible
+    as attributes or items, and are cast on first access. '''
+
+    def __init__(self, parser, combined):
+        self._parser = parser
+        self._readers = dict(combined)
+        self._values = {}
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+
+        value = self._parser._cast(key, self._readers[key])
+        self._values[key] = value
+        return value
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __contains__(self, key):
+        return key in self._readers
+
+    def __iter__(self):
+        return iter(self._readers)
+
+    def __len__(self):
+        return len(self._readers)
+
+    def keys(self):
+        return list(self._readers)
+
+    def validate_all(self):
+        ''' Cast all values now, raising the first cast error. '''
+
+        for key in self._readers:
+            self[key]
+
+        return self
+
+
+class ParseState(object):
+    ''' Result of :py:meth:`Parser.parse_state`. ``values`` is the dict of
+    argument name -> value; values are also accessible as items. '''
+
+    def __init__(self, readers, values):
+        self._readers = readers
+        self.values = values
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def __iter__(self):
+        return iter(self.values)
+
+
+def _raw_value(reader):
+    ''' Hashable, uncast value held by ``reader`` (or a list of them). '''
+
+    if isinstance(reader, list):
+        return tuple(_raw_value(item) for item in reader)
+
+    while isinstance(reader, Caster):
+        reader = reader._reader
+
+    value = reader.value
+    if isinstance(value, list):
+        value = tuple(value)
+
+    return value
+
+
+class ConfigWatcher(object):
+    ''' Keeps the values of a parse up to date with the config files it was
+    given. Created via :py:meth:`Parser.watch`. Changes are detected by
+    polling the files' mtime, size and inode.
+
+    The current values are available as :attr:`snapshot`, a ``dict`` that is
+    replaced (never modified) on each reload. '''
+
+    def __init__(self, parser, args=None, interval=1.0, on_error=None):
+        self._parser = parser
+        self._interval = interval
+        self._on_error = on_error
+        self._subscribers = []
+        self._thread = None
+        self._stop = threading.Event()
+
+        self._base = parser._command_line_readers(args)
+        combined = parser._resolve(self._base)
+        self._raw = dict((key, _raw_value(value)) for key, value in combined)
+        self.snapshot = parser._assign(combined)
+        self._state = self._watched_state()
+
+    def _watched_state(self):
+        return tuple((path, _path_state(path)) for path in
+                self._parser._config_paths(self._base))
+
+    def subscribe(self, callback):
+        ''' Call ``callback(snapshot, diff)`` after each successful reload
+        that changed values, where ``diff`` maps each changed argument name to
+        its ``(old, new)`` values. '''
+
+        self._subscribers.append(callback)
+        return self
+
+    def check(self):
+        ''' Reload if any watched file changed. Returns the diff of the
+        reload, or ``None`` if nothing changed or the reload failed. A reload
+        fails on invalid values, and on config files that are malformed or
+        missing (e.g. while being rewritten); the error is passed to
+        ``on_error``, and the previous snapshot is kept. '''
+
+        state = self._watched_state()
+        if state == self._state:
+            return None
+
+        self._state = state
+        parser = self._parser
+
+        try:
+            combined = parser._resolve(self._base)
+            raw = dict((key, _raw_value(value)) for key, value in combined)
+            changed = set(key for key in raw if raw[key] != self._raw.get(key))
+            assigned = parser._assign(combined, changed)
+        except (ArgumentError, cpars.Error, IOError, OSError) as e:
+            if self._on_error is not None:
+                self._on_error(e)
+            return None
+
+        if not changed:
+            return None
+
+        old = self.snapshot
+        snapshot = dict(old)
+        snapshot.update(assigned)
+        diff = dict((key, (old.get(key), assigned[key])) for key in changed)
+
+        self._raw = raw
+        self.snapshot = snapshot
+
+        for callback in self._subscribers:
+            callback(snapshot, diff)
+
+        return diff
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            try:
+                self.check()
+            except Exception as e:
+                # e.g. from a subscriber; keep watching regardless
+                if self._on_error is not None:
+                    try:
+                        self._on_error(e)
+                    except Exception:
+                        pass
+
+    def start(self):
+        ''' Check for changes every ``interval`` seconds on a daemon thread.
+        '''
+
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+# ---------- warm parser server ---------- #
+
+
+def _exit_code(e):
+    ''' Exit code of :class:`SystemExit` ``e``, as the interpreter would
+    compute it. '''
+
+    if e.code is None:
+        return 0
+
+    if isinstance(e.code, int):
+        return e.code
+
+    print(e.code, file=sys.stderr)
+    return 1
+
+
+def _run_child(parser, main, argv):
+    ''' Parse ``argv`` and run ``main`` on the values; returns the exit code.
+    Meant to run in a forked child. '''
+
+    try:
+        result = main(parser.process_command_line(argv))
+        code = result if isinstance(result, int) else 0
+    except SystemExit as e:
+        code = _exit_code(e)
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+        code = 1
+
+    for stream in (sys.stdout, sys.stderr, parser.out):
+        try:
+            stream.flush()
+        except (IOError, OSError, ValueError):
+            pass
+
+    return code
+
+
+def _fork():
+    # flush, so that buffered output is not written by both processes
+    sys.stdout.flush()
+    sys.stderr.flush()
+    return os.fork()
+
+
+def _status_code(status):
+    ''' Exit code from a ``waitpid`` status, with the shell's convention for
+    children killed by signals. '''
+
+    if os.WIFSIGNALED(status):
+        return 128 + os.WTERMSIG(status)
+
+    return os.WEXITSTATUS(status)
+
+
+def _wait_any(pids):
+    ''' Wait for one of the children ``pids`` to exit, and return its pid and
+    status. Unlike ``os.waitpid(-1, 0)``, other children of this process are
+    left for their owners (e.g. ``subprocess``) to collect. '''
+
+    if len(pids) == 1:
+        pid = next(iter(pids))
+        return pid, os.waitpid(pid, 0)[1]
+
+    delay = 0.0005
+    while True:
+        for pid in pids:
+            done, status = os.waitpid(pid, os.WNOHANG)
+            if done:
+                return pid, status
+
+        time.sleep(delay)
+        delay = min(2 * delay, 0.05)
+
+
+def _freeze():
+    ''' Move all current objects to the garbage collector's permanent
+    generation, so that collections in forked children do not touch (and
+    copy) the parent's pages. '''
+
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+
+class Preloaded(object):
+    ''' Runs a program many times by forking a preloaded process. Created
+    via :func:`preload`. '''
+
+    def __init__(self, parser, main):
+        self._parser = parser
+        self._main = main
+
+    def _spawn(self, argv):
+        pid = _fork()
+        if pid == 0:
+            code = 1
+            try:
+                sys.argv[1:] = argv
+                code = _run_child(self._parser, self._main, argv)
+            finally:
+                os._exit(code)
+
+        return pid
+
+    def run(self, argv):
+        ''' Run the program on command line ``argv`` in a forked child, and
+        return its exit code. '''
+
+        return _status_code(os.waitpid(self._spawn(argv), 0)[1])
+
+    def run_many(self, argvs, jobs=None):
+        ''' Run the program on each command line of ``argvs``, with up to
+        ``jobs`` (by default, the number of CPUs) children at once. Returns
+        the exit codes in the order of ``argvs``. '''
+
+        if jobs is None:
+            import multiprocessing
+            jobs = multiprocessing.cpu_count()
+
+        argvs = list(argvs)
+        codes = [None] * len(argvs)
+        running = {}
+
+        for i, argv in enumerate(argvs):
+            while len(running) >= jobs:
+                pid, status = _wait_any(running)
+                codes[running.pop(pid)] = _status_code(status)
+
+            running[self._spawn(argv)] = i
+
+        for pid, i in iteritems(running):
+            codes[i] = _status_code(os.waitpid(pid, 0)[1])
+
+        return codes
+
+
+def preload(parser, setup):
+    '''
+
+    Prepare to run a program many times without paying for imports and
+    parser construction on each run. ``setup`` is called once with ``parser``;
+    it should do any heavy imports, add arguments to ``parser`` if not done
+    already, and return the program's main function. The returned
+    :class:`Preloaded` then runs the program in a forked child per command
+    line, which only parses its command line and calls main on the values:
+
+    ::
+
+        def setup(p):
+            import numpy
+            p.int('count')
+            return lambda values: work(numpy, values['count'])
+
+        runner = preload(Parser(), setup)
+        codes = runner.run_many([['--count', str(i)] for i in range(1000)])
+
+    Main may return an ``int`` exit code. Objects loaded by ``setup`` are
+    moved out of reach of the garbage collector (``gc.freeze``, where
+    available), so that children share rather than copy their memory.
+
+    '''
+
+    main = setup(parser)
+    _freeze()
+    return Preloaded(parser, main)
+
+
+def _recv_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+
+    return data
+
+
+class Server(object):
+    '''
+
+    Serves invocations of a command line program from a long-lived process,
+    avoiding interpreter startup and import costs for each invocation.
+    Clients (see :func:`client`) connect to the Unix domain socket at
+    ``path`` and pass their command line, working directory, environment and
+    standard streams. For each, the server forks a child that changes to the
+    client's working directory and environment, and runs ``main`` on the
+    values of ``parser`` parsing the command line. The child writes directly
+    to the client's streams, and its exit code is returned to the client.
+    ``main`` may return an ``int`` exit code. See :py:meth:`Parser.serve`.
+
+    '''
+
+    def __init__(self, path, parser, main):
+        import socket
+
+        self.path = path
+        self._parser = parser
+        self._main = main
+        self._children = set()
+
+        try:
+            if stat.S_ISSOCK(os.stat(path).st_mode):
+                # stale socket of a previous server
+                os.remove(path)
+        except OSError:
+            pass
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(path)
+        # clients run main as this user, with an environment of their choice
+        os.chmod(path, 0o600)
+        self._socket.listen(64)
+
+    def serve_forever(self):
+        while True:
+            self.handle_one()
+
+    def handle_one(self):
+        ''' Accept and serve a single client. The invocation runs
+        concurrently in a child process. '''
+
+        conn = self._socket.accept()[0]
+        fds = []
+        try:
+            try:
+                self._check_peer(conn)
+                request, fds = self._receive(conn)
+                pid = _fork()
+            except (IOError, OSError, ValueError, struct.error) as e:
+                # a bad client must not take the server down
+                print('blargs server: dropped client: %s' % e, file=sys.stderr)
+                return
+
+            if pid == 0:
+                code = 1
+                try:
+                    self._socket.close()
+                    code = self._child(conn, request, fds)
+                finally:
+                    os._exit(code)
+
+            self._children.add(pid)
+        finally:
+            conn.close()
+            for fd in fds:
+                os.close(fd)
+
+        self._reap()
+
+    def _check_peer(self, conn):
+        ''' Refuse clients running as another user, where the platform tells.
+        '''
+
+        import socket
+
+        option = getattr(socket, 'SO_PEERCRED', None)
+        if option is None:
+            # the socket's permissions are all there is
+            return
+
+        size = struct.calcsize('3i')
+        pid, uid, gid = struct.unpack('3i', conn.getsockopt(
+            socket.SOL_SOCKET, option, size))
+        if uid != os.getuid():
+            raise ValueError('client runs as user %d' % uid)
+
+    def _receive(self, conn):
+        import socket
+        import array
+
+        fds = array.array('i')
+        header, ancillary, flags, address = conn.recvmsg(4,
+                socket.CMSG_LEN(3 * fds.itemsize))
+        for level, kind, data in ancillary:
+            if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+
+        try:
+            header += _recv_exactly(conn, 4 - len(header))
+            size = struct.unpack('!I', header)[0]
+            request = json.loads(_recv_exactly(conn, size).decode('utf-8'))
+            if not (isinstance(request, dict) and
+                    isinstance(request.get('argv'), list) and
+                    isstring(request.get('cwd')) and
+                    isinstance(request.get('env'), dict)):
+                raise ValueError('malformed request')
+        except Exception:
+            for fd in fds:
+                os.close(fd)
+            raise
+
+        return request, list(fds)
+
+    def _child(self, conn, request, fds):
+        for target, fd in enumerate(fds[:3]):
+            os.dup2(fd, target)
+
+        # sys.std* need not be on fds 0-2, e.g. if the server's output is
+        # captured
+        stdout = sys.stdout
+        sys.stdin = os.fdopen(0, 'r')
+        sys.stdout = os.fdopen(1, 'w')
+        sys.stderr = os.fdopen(2, 'w')
+        if self._parser.out is stdout:
+            self._parser.out = sys.stdout
+
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        sys.argv[1:] = request['argv']
+
+        code = _run_child(self._parser, self._main, request['argv'])
+        conn.sendall(struct.pack('!i', code))
+        return code
+
+    def _reap(self):
+        ''' Collect the children that have exited, leaving other children of
+        the process alone. '''
+
+        for pid in list(self._children):
+            try:
+                done = os.waitpid(pid, os.WNOHANG)[0]
+            except OSError:
+                # collected elsewhere
+                done = pid
+
+            if done:
+                self._children.discard(pid)
+
+    def close(self):
+        self._socket.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self._reap()
+
+
+def client(path, argv=None, fds=(0, 1, 2)):
+    ''' Run ``argv`` (by default ``sys.argv[1:]``) on the :class:`Server` at
+    ``path``, passing the current directory, environment and the standard
+    stream file descriptors ``fds``. Returns the exit code. This can also be
+    run from the shell:
+
+    ::
+
+        python -m blargs /tmp/tool.sock --arg1 3
+
+    '''
+
+    import socket
+    import array
+
+    if argv is None:
+        argv = sys.argv[1:]
+
+    payload = json.dumps({'argv': list(argv), 'cwd': os.getcwd(),
+        'env': dict(os.environ)}).encode('utf-8')
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        sock.sendmsg([struct.pack('!I', len(payload))], [(socket.SOL_SOCKET,
+            socket.SCM_RIGHTS, array.array('i', fds).tobytes())])
+        sock.sendall(payload)
+
+        code = _recv_exactly(sock, 4)
+    finally:
+        sock.close()
+
+    if len(code) < 4:
+        # child died without reporting
+        return 1
+
+    return struct.unpack('!i', code)[0]
+
+# ---------- end warm parser server ---------- #
 
 
 __all__ = ['Parser']
 __version__ = '0.2.29b'
+
+
+if __name__ == '__main__':
+    sys.exit(client(sys.argv[1], sys.argv[2:]))
@@ -17,7 +17,8 @@ from blargs import (Parser, Option, UnspecifiedArgumentError, ConflictError, Arg
                    FormatError, ConditionError,
                    MultipleSpecifiedArgumentError,
                    ManyAllowedNoneSpecifiedArgumentError,
-                   MissingValueError, FailedConditionError)
+                   MissingValueError, FailedConditionError,
+                   AmbiguousArgumentError)
 
 
 import sys
@@ -155,6 +156,365 @@ b=3
         vals = p._process_command_line(['--a', fname])
         self.assertEqual(vals['b'], 'hello world')
 
+    def test_config_cache(self):
+        import blargs
+
+        fname = os.path.join(self._dir, 'config.cfg')
+        with open(fname, 'w') as w:
+            w.write('[myconfig]\nb = 3\n')
+
+        parses = []
+        parse_config = blargs._parse_config
+
+        def counting(path):
+            parses.append(path)
+            return parse_config(path)
+
+        def create():
+            p = Parser({})
+            p.config('a', snapshot_dir=self._dir)
+            p.int('b')
+            return p
+
+        blargs._parse_config = counting
+        try:
+            blargs.clear_config_cache()
+            self.assertEqual(create()._process_command_line(['--a', fname])['b'], 3)
+            self.assertEqual(create()._process_command_line(['--a', fname])['b'], 3)
+            self.assertEqual(len(parses), 1)
+
+            # cold cache is served by the pickled snapshot
+            blargs.clear_config_cache()
+            self.assertEqual(create()._process_command_line(['--a', fname])['b'], 3)
+            self.assertEqual(len(parses), 1)
+
+            # snapshots are private, even under a group-writable umask
+            umask = os.umask(0o002)
+            try:
+                for _ in range(2):
+                    blargs.clear_config_cache()
+                    self.assertEqual(create()._process_command_line(['--a',
+                        fname])['b'], 3)
+                with open(fname, 'a') as w:
+                    w.write('\n')
+                for _ in range(2):
+                    blargs.clear_config_cache()
+                    self.assertEqual(create()._process_command_line(['--a',
+                        fname])['b'], 3)
+            finally:
+                os.umask(umask)
+            self.assertEqual(len(parses), 2)
+
+            # snapshots others can write are not trusted
+            snapshots = [os.path.join(self._dir, name) for name in
+                    os.listdir(self._dir) if name.endswith('.pickle')]
+            os.chmod(snapshots[0], 0o666)
+            blargs.clear_config_cache()
+            self.assertEqual(create()._process_command_line(['--a', fname])['b'], 3)
+            self.assertEqual(len(parses), 3)
+
+            # changed file is reparsed
+            with open(fname, 'w') as w:
+                w.write('[myconfig]\nb = 42\n')
+            self.assertEqual(create()._process_command_line(['--a', fname])['b'], 42)
+            self.assertEqual(len(parses), 4)
+        finally:
+            blargs._parse_config = parse_config
+            blargs.clear_config_cache()
+
+    def test_config_declared_only(self):
+        fname = os.path.join(self._dir, 'config.cfg')
+        with open(fname, 'w') as w:
+            w.write('''[DEFAULT]
+root = /srv
+[other]
+x = 1
+[tool]
+# comment
+b = 3
+c = %(root)s/data
+unused = %(missing)s
+[later]
+b = 9
+''')
+
+        def create(**kw):
+            p = Parser({})
+            p.config('a', declared_only=True, **kw)
+            p.int('b').multiple()
+            p.str('c')
+            return p
+
+        vals = create()._process_command_line(['--a', fname])
+        self.assertEqual(sorted(vals['b']), [3, 9])
+        self.assertEqual(vals['c'], '/srv/data')
+        self.assertFalse('x' in vals)
+
+        vals = create(sections=['tool'])._process_command_line(['--a', fname])
+        self.assertEqual(vals['b'], [3])
+
+        vals = create(sections=['other'])._process_command_line(['--a', fname])
+        self.assertEqual(vals['b'], [None])
+        self.assertEqual(vals['c'], None)
+
+        # DEFAULT applies to sections before it too
+        with open(fname, 'w') as w:
+            w.write('''[tool]
+c = %(root)s/x
+[DEFAULT]
+root = /srv
+b = 4
+''')
+        vals = create()._process_command_line(['--a', fname])
+        self.assertEqual(vals['b'], [4])
+        self.assertEqual(vals['c'], '/srv/x')
+
+    def test_config_layers(self):
+        base = os.path.join(self._dir, 'base.ini')
+        confd = os.path.join(self._dir, 'conf.d')
+        os.mkdir(confd)
+
+        def write(path, text):
+            with open(path, 'w') as w:
+                w.write(text)
+
+        write(base, '[tool]\nworkers = 1\nname = base\nhost = localhost\n')
+        write(os.path.join(confd, '10-a.ini'), '[tool]\nworkers = 2\nfast = yes\n')
+        write(os.path.join(confd, '20-b.ini'), '[tool]\nworkers = 3\n')
+
+        p = Parser({})
+        p.int('workers')
+        p.str('name')
+        p.str('host')
+        p.flag('fast')
+        p.config_layers(base, confd, os.path.join(self._dir, 'missing.ini'))
+
+        vals = p._process_command_line([])
+        self.assertEqual(vals['workers'], 3)
+        self.assertEqual(vals['name'], 'base')
+        self.assertTrue(vals['fast'])
+
+        vals = p._process_command_line(['--workers', '8'])
+        self.assertEqual(vals['workers'], 8)
+
+        write(os.path.join(confd, '20-b.ini'), '[tool]\nname = override\n')
+        vals = p._process_command_line([])
+        self.assertEqual(vals['workers'], 2)
+        self.assertEqual(vals['name'], 'override')
+        self.assertEqual(vals['host'], 'localhost')
+
+    def test_config_watcher(self):
+        fname = os.path.join(self._dir, 'config.cfg')
+
+        def write(text):
+            with open(fname, 'w') as w:
+                w.write('[tool]\n' + text)
+
+        write('b = 3\nc = x\n')
+
+        p = Parser({})
+        p.config('conf')
+        p.int('b')
+        p.str('c')
+
+        errors = []
+        published = []
+        watcher = p.watch(['--conf', fname], on_error=errors.append)
+        watcher.subscribe(lambda snapshot, diff: published.append(diff))
+        self.assertEqual(watcher.snapshot['b'], 3)
+        self.assertEqual(watcher.check(), None)
+
+        first = watcher.snapshot
+        write('b = 15\nc = x\n')
+        self.assertEqual(watcher.check(), {'b': (3, 15)})
+        self.assertEqual(published, [{'b': (3, 15)}])
+        self.assertEqual(watcher.snapshot['b'], 15)
+        self.assertEqual(first['b'], 3)
+
+        write('b = bad\nc = x\n')
+        self.assertEqual(watcher.check(), None)
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(isinstance(errors[0], FormatError))
+        self.assertEqual(watcher.snapshot['b'], 15)
+
+        # half written
+        write('b = 20\n[broken')
+        self.assertEqual(watcher.check(), None)
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(watcher.snapshot['b'], 15)
+
+        os.remove(fname)
+        self.assertEqual(watcher.check(), None)
+        self.assertEqual(len(errors), 3)
+        self.assertTrue(isinstance(errors[2], (IOError, OSError)))
+        self.assertEqual(watcher.snapshot['b'], 15)
+
+        write('c = y\n')
+        self.assertEqual(watcher.check(), {'b': (15, None), 'c': ('x', 'y')})
+
+    def test_lazy(self):
+        dirpath = os.path.join(self._dir, 'created')
+
+        def create():
+            p = Parser().lazy()
+            p.int('a')
+            p.int('b')
+            p.int('c').requires(p['a'] < 10)
+            p.directory('d', create=True)
+            return p
+
+        args = create()._process_command_line(['--a', '1', '--b', 'x',
+            '--d', dirpath])
+        self.assertEqual(args.a, 1)
+        self.assertEqual(args['a'], 1)
+        self.assertFalse(os.path.exists(dirpath))
+        self.assertEqual(args.d, dirpath)
+        self.assertTrue(os.path.isdir(dirpath))
+        self.assertRaises(FormatError, getattr, args, 'b')
+        self.assertRaises(FormatError, args.validate_all)
+        self.assertRaises(AttributeError, getattr, args, 'missing')
+
+        args = create()._process_command_line(['--a', '1'])
+        self.assertEqual(args.validate_all().c, None)
+
+        self.assertRaises(ConditionError, create()._process_command_line,
+                ['--a', '11', '--c', '1'])
+
+    def test_memoize(self):
+        fname = os.path.join(self._dir, 'config.cfg')
+        with open(fname, 'w') as w:
+            w.write('[tool]\nb = 3\n')
+
+        casts = []
+
+        def cast(value):
+            casts.append(value)
+            return int(value)
+
+        p = Parser().memoize(maxsize=2)
+        p.str('a').cast(cast).multiple()
+        p.str('b').cast(cast)
+        p.config('conf')
+
+        vals = p._process_command_line(['--a', '1'])
+        self.assertEqual(vals['a'], [1])
+        vals['a'].append(5)
+        self.assertEqual(p._process_command_line(['--a', '1'])['a'], [1])
+        self.assertEqual(p.cache_info(), (1, 1, 2, 1))
+        self.assertEqual(casts, ['1'])
+
+        self.assertEqual(p._process_command_line(['--conf', fname])['b'], 3)
+        self.assertEqual(p._process_command_line(['--conf', fname])['b'], 3)
+        with open(fname, 'w') as w:
+            w.write('[tool]\nb = 42\n')
+        self.assertEqual(p._process_command_line(['--conf', fname])['b'], 42)
+
+        # evicted
+        p._process_command_line(['--a', '2'])
+        p._process_command_line(['--a', '1'])
+        self.assertEqual(p.cache_info().currsize, 2)
+        self.assertEqual(p.cache_info().hits, 2)
+
+        self.assertRaises(FormatError, p._process_command_line, ['--b', 'x'])
+        self.assertRaises(FormatError, p._process_command_line, ['--b', 'x'])
+
+        p = Parser().memoize()
+        p.file('f')
+        p._process_command_line([])
+        p._process_command_line([])
+        self.assertEqual(p.cache_info().currsize, 0)
+
+    def test_server(self):
+        import threading
+        from blargs import Server, client
+
+        path = os.path.join(self._dir, 'sock')
+        p = Parser()
+        p.int('count').required()
+
+        def main(values):
+            print('count=%d cwd=%s env=%s' % (values['count'], os.getcwd(),
+                os.environ.get('BLARGS_TEST')))
+            return values['count']
+
+        server = Server(path, p, main)
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+        thread = threading.Thread(target=lambda: [server.handle_one() for _ in
+            range(4)])
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        thread.start()
+
+        cwd = os.getcwd()
+        outname = os.path.join(self._dir, 'out')
+        stdin = os.open(os.devnull, os.O_RDONLY)
+        os.environ['BLARGS_TEST'] = 'yes'
+        try:
+            # clients hanging up early, or sending garbage, are dropped
+            import socket
+            for data in (b'', b'\xff\xff\xff\xffjunk'):
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(path)
+                sock.sendall(data)
+                sock.close()
+
+            os.chdir(self._dir)
+            with open(outname, 'w') as out:
+                fds = (stdin, out.fileno(), out.fileno())
+                self.assertEqual(client(path, ['--count', '3'], fds), 3)
+                self.assertEqual(client(path, [], fds), 1)
+        finally:
+            os.chdir(cwd)
+            os.close(stdin)
+            del os.environ['BLARGS_TEST']
+            thread.join()
+            server.close()
+            dropped = sys.stderr.getvalue()
+            sys.stderr = stderr
+
+        self.assertEqual(dropped.count('dropped client'), 2)
+
+        with open(outname) as f:
+            lines = f.read().splitlines()
+
+        self.assertEqual(lines[0], 'count=3 cwd=%s env=yes' %
+                os.path.realpath(self._dir))
+        self.assertEqual(lines[1], 'Error: No value passed for count')
+        self.assertFalse(os.path.exists(path))
+
+    def test_preload(self):
+        from blargs import preload
+
+        setups = []
+
+        def setup(p):
+            setups.append(1)
+            p.int('count').required()
+            p.out = out
+
+            def main(values):
+                with open(os.path.join(self._dir, str(values['count'])), 'w'):
+                    pass
+                return values['count']
+
+            return main
+
+        outname = os.path.join(self._dir, 'out')
+        with open(outname, 'w') as out:
+            runner = preload(Parser(), setup)
+            self.assertEqual(runner.run(['--count', '3']), 3)
+            self.assertEqual(runner.run([]), 1)
+            self.assertEqual(runner.run_many([['--count', str(i)] for i in
+                range(10)], jobs=3), list(range(10)))
+
+        with open(outname) as f:
+            lines = f.read().splitlines()
+
+        self.assertEqual(lines[0], 'Error: No value passed for count')
+        self.assertEqual(setups, [1])
+        self.assertEqual(sorted(os.listdir(self._dir)),
+                sorted([str(i) for i in range(10)] + ['out']))
+
     def test_file(self):
         def create():
             p = Parser()
@@ -207,6 +567,312 @@ b=3
         vals = p._process_command_line(['--b', dirpath])
         self.assertEqual(vals['b'], dirpath)
 
+    def test_concurrent_io(self):
+        paths = []
+        for name in 'abcd':
+            paths.append(os.path.join(self._dir, name))
+            with open(paths[-1], 'w') as w:
+                w.write(name)
+
+        def create():
+            p = Parser().concurrent_io(4)
+            p.file('inputs').multiple()
+            p.directory('out')
+            return p
+
+        vals = create()._process_command_line(sum((['--inputs', path] for
+            path in paths), ['--out', self._dir]))
+        self.assertEqual([f.read() for f in vals['inputs']], list('abcd'))
+        [f.close() for f in vals['inputs']]
+        self.assertEqual(vals['out'], self._dir)
+
+        self.assertRaises(IOError, create()._process_command_line, ['--out',
+            paths[0]])
+
+        opened = []
+
+        class Tracking(object):
+            _io = True
+            _side_effects = True
+
+            def __call__(self, name):
+                opened.append(open(name))
+                return opened[-1]
+
+        missing = [os.path.join(self._dir, name) for name in ('x', 'y')]
+        p = Parser().concurrent_io(4)
+        p.str('inputs').multiple().cast(Tracking())
+        try:
+            p._process_command_line(sum((['--inputs', path] for path in
+                paths[:2] + missing + paths[2:]), []))
+            self.fail()
+        except IOError as e:
+            self.assertEqual(e.filename, missing[0])
+
+        self.assertEqual(len(opened), 4)
+        self.assertTrue(all(f.closed for f in opened))
+
+        # serially, casting stops at the first missing file
+        del opened[:]
+        p = Parser()
+        p.str('inputs').multiple().cast(Tracking())
+        self.assertRaises(IOError, p._process_command_line, sum((['--inputs',
+            path] for path in paths[:2] + missing), []))
+        self.assertEqual(len(opened), 2)
+        self.assertTrue(all(f.closed for f in opened))
+
+    def test_lines(self):
+        import gzip
+        import bz2
+
+        data = u'first\nsecond \u00e9\r\n\nlast'.encode('utf-8')
+        openers = [open, gzip.open, bz2.BZ2File]
+        try:
+            import lzma
+            openers.append(lzma.open)
+        except ImportError:
+            pass
+
+        for i, opener in enumerate(openers):
+            fname = os.path.join(self._dir, 'data%d' % i)
+            w = opener(fname, 'wb')
+            w.write(data)
+            w.close()
+
+            p = Parser()
+            p.lines('input')
+            vals = p._process_command_line(['--input', fname])
+            self.assertEqual(list(vals['input']), [u'first', u'second \u00e9',
+                u'', u'last'])
+
+        p = Parser()
+        p.records('input', ';', encoding=None, buffer_size=2)
+        with open(fname, 'wb') as w:
+            w.write(b'a;bcd;;e;')
+        vals = p._process_command_line(['--input', fname])
+        self.assertEqual(list(vals['input']), [b'a', b'bcd', b'', b'e'])
+
+        import io
+        stdin = sys.stdin
+
+        class Stdin(object):
+            buffer = io.BufferedReader(io.BytesIO(gzip.compress(data) if
+                hasattr(gzip, 'compress') else data))
+
+        sys.stdin = Stdin()
+        try:
+            p = Parser()
+            p.lines('input')
+            records = p._process_command_line(['--input', '-'])['input']
+            self.assertEqual(list(records)[-1], u'last')
+            self.assertFalse(Stdin.buffer.closed)
+        finally:
+            sys.stdin = stdin
+
+        p = Parser()
+        p.lines('input')
+        self.assertRaises(IOError, p._process_command_line, ['--input',
+            os.path.join(self._dir, 'missing')])
+
+    def test_validate_files(self):
+        out = os.path.join(self._dir, 'result.csv')
+        with open(out, 'w') as w:
+            w.write('kept')
+
+        p = Parser()
+        p.file('out', mode='w')
+        p.output_file('o2')
+        p.directory('mk', create=True)
+        p.file('inp')
+        p.int('n')
+
+        mk = os.path.join(self._dir, 'mk')
+        errors = p.validate(['--out', out, '--o2', os.path.join(self._dir,
+            'x'), '--mk', mk, '--inp', out, '--n', 'q'])
+        self.assertEqual([(type(e), e.names) for e in errors],
+                [(FormatError, ('n',))])
+
+        with open(out) as f:
+            self.assertEqual(f.read(), 'kept')
+        self.assertEqual(os.listdir(self._dir), ['result.csv'])
+
+        self.assertRaises(IOError, p.validate, ['--inp', mk])
+        self.assertRaises(IOError, p.validate, ['--out', os.path.join(mk,
+            'x')])
+
+    def test_output_file(self):
+        fname = os.path.join(self._dir, 'out.txt')
+
+        def create(**kw):
+            p = Parser()
+            p.output_file('output', **kw)
+            return p
+
+        output = create()._process_command_line(['--output', fname])['output']
+        output.write('hello')
+        self.assertFalse(os.path.exists(fname))
+        output.close()
+        self.assertTrue(output.closed)
+        with open(fname) as f:
+            self.assertEqual(f.read(), 'hello')
+        self.assertEqual(os.listdir(self._dir), ['out.txt'])
+
+        os.chmod(fname, 0o640)
+        output = create(mode='wb')._process_command_line(['--output',
+            fname])['output']
+        try:
+            with output:
+                output.write(b'partial')
+                raise KeyError
+        except KeyError:
+            pass
+        with open(fname) as f:
+            self.assertEqual(f.read(), 'hello')
+        self.assertEqual(os.listdir(self._dir), ['out.txt'])
+
+        with create()._process_command_line(['--output', fname])['output'] \
+                as output:
+            output.write('bye')
+        with open(fname) as f:
+            self.assertEqual(f.read(), 'bye')
+        self.assertEqual(os.stat(fname).st_mode & 0o777, 0o640)
+
+        p = create()
+        p.int('n')
+        self.assertRaises(FormatError, p._process_command_line, ['--output',
+            fname, '--n', 'x'])
+        self.assertEqual(os.listdir(self._dir), ['out.txt'])
+
+        output = create(atomic=False)._process_command_line(['--output',
+            fname])['output']
+        self.assertEqual(os.stat(fname).st_size, 0)
+        output.close()
+
+        self.assertRaises(ValueError, create, mode='a')
+
+        # new files follow the umask at the time they are created
+        fname = os.path.join(self._dir, 'new.txt')
+        umask = os.umask(0o027)
+        try:
+            create()._process_command_line(['--output', fname])[
+                'output'].close()
+        finally:
+            os.umask(umask)
+        self.assertEqual(os.stat(fname).st_mode & 0o777, 0o640)
+
+    def test_tree(self):
+        for path in ('a', 'b', os.path.join('b', 'c'), os.path.join('b', 'd'),
+                os.path.join('b', 'c', 'e')):
+            os.mkdir(os.path.join(self._dir, path))
+        for path in ('x.log', 'y.txt', os.path.join('b', 'z.log'),
+                os.path.join('b', 'c', 'e', 'w.log'),
+                os.path.join('b', 'd', 'v.LOG')):
+            with open(os.path.join(self._dir, path), 'w') as w:
+                w.write('data')
+
+        def walk(**kw):
+            p = Parser()
+            p.tree('root', **kw)
+            vals = p._process_command_line(['--root', self._dir])
+            return sorted(os.path.relpath(entry.path, self._dir) for entry in
+                    vals['root'])
+
+        logs = ['b/c/e/w.log', 'b/z.log', 'x.log']
+        logs = [os.path.join(*path.split('/')) for path in logs]
+        self.assertEqual(walk(pattern='*.log'), logs)
+        self.assertEqual(walk(pattern='*.log', workers=4), logs)
+        self.assertEqual(walk(pattern='*.log', recursive=False), ['x.log'])
+        self.assertEqual(len(walk()), 5)
+
+        p = Parser()
+        p.tree('root')
+        tree = p._process_command_line(['--root', self._dir])['root']
+        self.assertEqual(len(list(tree)), len(list(tree)))
+        self.assertRaises(IOError, p._process_command_line, ['--root',
+            os.path.join(self._dir, 'x.log')])
+
+    def test_glob(self):
+        for path in ('a', os.path.join('a', 'b'), '.hidden'):
+            os.mkdir(os.path.join(self._dir, path))
+        for path in ('x.txt', 'y.log', os.path.join('a', 'z.txt'),
+                os.path.join('a', 'b', 'w.txt'), os.path.join('.hidden',
+                    'v.txt')):
+            with open(os.path.join(self._dir, path), 'w') as w:
+                w.write('data')
+
+        def expand(*patterns):
+            p = Parser()
+            p.glob('inputs').multiple()
+            args = []
+            for pattern in patterns:
+                args += ['--inputs', os.path.join(self._dir, pattern)]
+            return p._process_command_line(args)['inputs']
+
+        def relative(paths):
+            return sorted(os.path.relpath(path, self._dir) for path in paths)
+
+        import types
+        matches = expand('**', '*.txt')
+        self.assertTrue(isinstance(matches, types.GeneratorType))
+        self.assertEqual(relative(matches), ['.', 'a', os.path.join('a', 'b'),
+            os.path.join('a', 'b', 'w.txt'), os.path.join('a', 'z.txt'),
+            'x.txt', 'y.log'])
+
+        self.assertEqual(relative(expand(os.path.join('**', '*.txt'), '*.txt',
+            os.path.join('a', '*.txt'))), [os.path.join('a', 'b', 'w.txt'),
+                os.path.join('a', 'z.txt'), 'x.txt'])
+        self.assertEqual(relative(expand('*.log')), ['y.log'])
+        self.assertEqual(relative(expand('.*/*')), [os.path.join('.hidden',
+            'v.txt')])
+        self.assertEqual(relative(expand('nothing*')), [])
+
+        p = Parser()
+        p.glob('input')
+        p.memoize()
+        args = ['--input', os.path.join(self._dir, '*.txt')]
+        self.assertEqual(len(list(p._process_command_line(args)['input'])), 1)
+        self.assertEqual(len(list(p._process_command_line(args)['input'])), 1)
+        self.assertEqual(p._process_command_line([])['input'], None)
+
+    def test_help_cache(self):
+        p = Parser()
+        a = p.int('a')
+        p.out = StringIO()
+        p.print_help()
+        first = p.out.getvalue()
+        self.assertTrue('--a <int>' in first)
+
+        p.out = StringIO()
+        p.print_help()
+        self.assertEqual(p.out.getvalue(), first)
+
+        p.float('b').required()
+        a.described_as('a fun variable')
+        p.set_help_prefix('Prefix')
+        p.out = StringIO()
+        p.print_help()
+        lines = p.out.getvalue().splitlines()
+        self.assertTrue(lines[0].endswith('[--a <int>] [--b <float>]'))
+        self.assertEqual(lines[1], 'Prefix')
+        self.assertTrue('a fun variable' in lines[4])
+        self.assertTrue(lines[5].startswith('   !--b <float>'))
+
+        class Terminal(StringIO):
+            def isatty(self):
+                return True
+
+        fname = os.path.join(self._dir, 'paged')
+        p.use_pager('cat > %s' % fname)
+        p.out = Terminal()
+        p.print_help()
+        self.assertEqual(p.out.getvalue(), '')
+        with open(fname) as f:
+            self.assertEqual(f.read().splitlines(), lines)
+
+        p.use_pager('blargs-no-such-pager 2>/dev/null')
+        p.print_help()
+        self.assertEqual(p.out.getvalue().splitlines(), lines)
+
 
 class MultiDictTestCase(unittest.TestCase):
     def test_multidict(self):
@@ -241,6 +907,36 @@ class TestCase(unittest.TestCase):
             vals = p._process_command_line(['--%s' % port, '2222'])
             self.assertEqual(vals[port], 2222)
 
+    def test_env_prefix(self):
+        def create():
+            p = Parser({})
+            p.int('port').required()
+            p.flag('dry-run')
+            p.str('name').default('x')
+            p.environment('APP_')
+            return p
+
+        env = {'APP_PORT': '5000', 'APP_DRY_RUN': 'yes', 'NAME': 'y'}
+        os.environ.update(env)
+        try:
+            vals = create()._process_command_line([])
+            self.assertEqual(vals['port'], 5000)
+            self.assertTrue(vals['dry-run'])
+            self.assertEqual(vals['name'], 'x')
+
+            vals = create()._process_command_line(['--port', '1'])
+            self.assertEqual(vals['port'], 1)
+
+            os.environ['APP_PORT'] = 'yes'
+            self.assertRaises(FormatError, create()._process_command_line, [])
+
+            del os.environ['APP_PORT']
+            self.assertRaises(MissingRequiredArgumentError,
+                    create()._process_command_line, [])
+        finally:
+            for key in env:
+                os.environ.pop(key, None)
+
     def test_help(self):
         p = Parser()
         p.int('a').described_as('a fun variable')
@@ -806,6 +1502,88 @@ class TestCase(unittest.TestCase):
         vals = p._process_command_line(['--x', '6'])
         self.assertEqual(vals['x'], 6)
     
+    def test_default_factory(self):
+        calls = []
+
+        def factory():
+            calls.append(1)
+            return '7'
+
+        p = Parser()
+        p.int('x').default_factory(factory)
+        p.int('y').requires(p['x'])
+        vals = p._process_command_line(['--x', '1', '--y', '2'])
+        self.assertEqual(vals['x'], 1)
+        self.assertEqual(calls, [])
+
+        vals = p._process_command_line(['--y', '2'])
+        self.assertEqual(vals['x'], 7)
+        vals = p._process_command_line([])
+        self.assertEqual(vals['x'], 7)
+        self.assertEqual(calls, [1])
+
+        p = Parser().lazy()
+        p.int('x').default_factory(factory)
+        p.int('y')
+        self.assertEqual(p._process_command_line(['--y', '2']).y, 2)
+        self.assertEqual(calls, [1])
+
+    def test_result_type(self):
+        import pickle
+
+        p = Parser()
+        p.int('workers').default(2)
+        p.flag('dry-run')
+        result_type = p.result_type()
+
+        args = p._process_command_line(['--dry-run'])
+        self.assertTrue(isinstance(args, result_type))
+        self.assertEqual(args.workers, 2)
+        self.assertTrue(args.dry_run)
+        self.assertTrue(args['dry-run'])
+        self.assertFalse(args.help)
+        self.assertRaises(AttributeError, setattr, args, 'other', 1)
+        self.assertEqual(pickle.loads(pickle.dumps(args)), args)
+
+        p.str('name')
+        args = p._process_command_line([])
+        self.assertEqual(args.name, None)
+        self.assertEqual(args._fields, ('help', 'workers', 'dry_run', 'name'))
+
+        p = Parser()
+        p.int('a.b')
+        self.assertRaises(ValueError, p.result_type)
+
+    def test_parse_line(self):
+        store = {}
+        p = Parser(store)
+        p.str('user').required()
+        p.flag('admin')
+        p.int('n').default(1)
+        p.out = StringIO()
+
+        vals = p.parse_line('--user "Ann Smith" --admin --n 3')
+        self.assertEqual(vals['user'], 'Ann Smith')
+        self.assertTrue(vals['admin'])
+        self.assertEqual(vals['n'], 3)
+
+        vals = p.parse_line('--user bob')
+        self.assertEqual(vals['user'], 'bob')
+        self.assertFalse(vals['admin'])
+        self.assertEqual(vals['n'], 1)
+        self.assertEqual(store, {})
+
+        self.assertRaises(MissingRequiredArgumentError, p.parse_line, '--admin')
+        self.assertRaises(FormatError, p.parse_line, '--user "unclosed')
+        self.assertEqual(p.parse_line('--help'), None)
+        self.assertTrue(p.out.getvalue().startswith('Usage'))
+
+        results = list(p.repl(StringIO('--user a\n\n--n x --user b\n--user c\n')))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0]['user'], 'a')
+        self.assertTrue(isinstance(results[1], FormatError))
+        self.assertEqual(results[2]['user'], 'c')
+
     def test_cast(self):
         p = Parser()
         p.str('x').cast(int)
@@ -894,6 +1672,258 @@ class TestCase(unittest.TestCase):
         except UnspecifiedArgumentError as e:
             self.assertEqual(str(e), UnspecifiedArgumentError.message.format(arg))
 
+    def test_abbreviations(self):
+        def create():
+            p = Parser().abbreviations()
+            p.flag('verbose').shorthand('vv')
+            p.int('version')
+            p.int('ver')
+            p.str('name')
+            return p
+
+        vals = create()._process_command_line(['--verb', '--n', 'x'])
+        self.assertTrue(vals['verbose'])
+        self.assertEqual(vals['name'], 'x')
+        vals = create()._process_command_line(['--vers', '3', '--ver', '4'])
+        self.assertEqual(vals['version'], 3)
+        self.assertEqual(vals['ver'], 4)
+        self.assertTrue(create()._process_command_line(['-v'])['verbose'])
+
+        try:
+            create()._process_command_line(['--ve', '3'])
+            self.fail()
+        except AmbiguousArgumentError as e:
+            self.assertEqual(e.candidates, ['--ver', '--verbose', '--version'])
+
+        self.assertRaises(UnspecifiedArgumentError,
+                create()._process_command_line, ['--x'])
+
+        p = Parser()
+        p.flag('verbose')
+        self.assertRaises(UnspecifiedArgumentError, p._process_command_line,
+                ['--verb'])
+
+    def test_suggestions(self):
+        def create():
+            p = Parser()
+            p.flag('verbose').shorthand('v')
+            p.int('version')
+            p.str('name')
+            p.out = StringIO()
+            p._sys_exit_error = FakeSystemExit
+            return p
+
+        try:
+            create()._process_command_line(['--verbos'])
+            self.fail()
+        except UnspecifiedArgumentError as e:
+            self.assertEqual(e.suggestions, ['--verbose'])
+            self.assertEqual(str(e), UnspecifiedArgumentError.message.format(
+                'verbos'))
+
+        try:
+            create()._process_command_line(['--versoin'])
+            self.fail()
+        except UnspecifiedArgumentError as e:
+            self.assertEqual(e.suggestions, ['--version'])
+
+        try:
+            create()._process_command_line(['--zzzzzz'])
+            self.fail()
+        except UnspecifiedArgumentError as e:
+            self.assertEqual(e.suggestions, [])
+
+        p = create()
+        self.assertRaises(FakeSystemExit, p.process_command_line, ['--nmae'])
+        self.assertEqual(p.out.getvalue().splitlines()[:2],
+                ['Error: illegal option nmae', 'Did you mean --name?'])
+
+    def test_completion(self):
+        p = Parser()
+        p.file('input').shorthand('i')
+        p.directory('out')
+        p.enum('mode', ('fast', 'slow'))
+        p.int('count').multiple()
+
+        bash = p.completion('bash', 'prog')
+        self.assertTrue("'--input'|'-i') COMPREPLY=($(compgen -f" in bash)
+        self.assertTrue("'--out') COMPREPLY=($(compgen -d" in bash)
+        self.assertTrue("compgen -W 'fast slow'" in bash)
+        self.assertTrue("'--help'" not in bash.split('esac')[0])
+        self.assertTrue(bash.rstrip().endswith(
+            'complete -o filenames -F _prog_completion \'prog\''))
+
+        zsh = p.completion('zsh', 'prog')
+        self.assertTrue("'--out:directory:_files -/'" in zsh)
+        self.assertTrue("'--mode:value:(fast slow)'" in zsh)
+        self.assertTrue("'*--count:value: '" in zsh)
+        self.assertTrue("'-h[Print help message.]'" in zsh)
+
+        fish = p.completion('fish', 'prog')
+        self.assertTrue("complete -c 'prog' -l input -s i -r -F" in fish)
+        self.assertTrue("complete -c 'prog' -l mode -x -a 'fast slow'" in fish)
+
+        self.assertRaises(ValueError, p.completion, 'tcsh')
+        p.set_double_prefix('++')
+        self.assertRaises(ValueError, p.completion, 'fish')
+        self.assertTrue("'++input'" in p.completion('bash'))
+
+    def test_analyze(self):
+        def create():
+            p = Parser()
+            p.int('c')
+            p.int('b').requires(p['c'])
+            p.int('a').requires(p['b'], p['c'], p['c'] > 2)
+            p.int('d').conflicts(p['b'])
+            p['b'].conflicts(p['d'])
+            p.all_if_any(p.int('x'), p.int('y'), p.int('z'))
+            p.int('e').requires(p['b']).conflicts(p['c'])
+            return p
+
+        report = create().analyze()
+        self.assertEqual(report.redundant, [('requires', 'a', 'c'),
+            ('requires', 'x', 'y'), ('requires', 'y', 'x'),
+            ('conflicts', 'd', 'b')])
+        self.assertEqual(report.cycles, [('x', 'y', 'z')])
+        self.assertEqual(report.unsatisfiable, [('e', 'c', 'e')])
+
+        for analyze in (False, True):
+            def parse(*args):
+                p = create()
+                if analyze:
+                    p.analyze()
+                return p._process_command_line(list(args))
+
+            parse('--a', '1', '--b', '2', '--c', '3')
+            parse('--x', '1', '--y', '1', '--z', '1')
+            self.assertRaises(DependencyError, parse, '--a', '1', '--b', '2')
+            self.assertRaises(ConditionError, parse, '--a', '1', '--b', '2',
+                    '--c', '1')
+            self.assertRaises(DependencyError, parse, '--x', '1', '--y', '1')
+            self.assertRaises(ConflictError, parse, '--b', '1', '--c', '1',
+                    '--d', '1')
+            self.assertRaises(ArgumentError, parse, '--e', '1', '--b', '1',
+                    '--c', '1')
+
+        p = create()
+        p.analyze()
+        p['c'].requires(p['a'])
+        self.assertEqual(p.analyze().cycles, [('a', 'b', 'c'), ('x', 'y',
+            'z')])
+
+    def test_revalidate(self):
+        casts = []
+
+        def counting(value):
+            casts.append(value)
+            return value
+
+        p = Parser()
+        p.int('workers').default(1)
+        p.int('max')
+        p.str('host').cast(counting)
+        p.flag('fast').requires(p['host'])
+        p['workers'].requires(p['workers'] <= p['max'])
+        p.str('tag').multiple()
+
+        base = p.parse_state(['--workers', '4', '--max', '10', '--host', 'a'])
+        self.assertEqual(base['workers'], 4)
+        self.assertEqual(casts, ['a'])
+
+        state = p.revalidate(base, {'workers': 8})
+        self.assertEqual(state['workers'], 8)
+        self.assertEqual(state['host'], 'a')
+        self.assertEqual(base['workers'], 4)
+        self.assertEqual(casts, ['a'])
+
+        self.assertRaises(ConditionError, p.revalidate, base, {'workers': 32})
+        self.assertEqual(p.revalidate(state, {'max': 40, 'workers': 32})[
+            'workers'], 32)
+        self.assertEqual(p.revalidate(state, {'workers': None})['workers'], 1)
+        self.assertEqual(p.revalidate(state, {'tag': ['x', 'y']})['tag'],
+                ['x', 'y'])
+        self.assertTrue(p.revalidate(state, {'fast': True})['fast'])
+        self.assertRaises(DependencyError, p.revalidate, state, {'fast': True,
+            'host': None})
+        self.assertRaises(FormatError, p.revalidate, state, {'max': 'many'})
+        self.assertRaises(UnspecifiedArgumentError, p.revalidate, state,
+                {'nope': 1})
+
+    def test_validate(self):
+        p = Parser()
+        p.int('workers').requires(p.int('max'))
+        p.str('host').required()
+        p.flag('a').conflicts(p.flag('b'))
+        p.int('n')
+        p.int('m').requires(p['n'] > 1)
+
+        self.assertEqual(p.validate(['--host', 'h']), [])
+
+        errors = p.validate(['--workers', 'x', '--bogus', '1', '--a', '--b',
+            '--n', 'q', '--m', '2', '--n', '3'])
+        self.assertEqual([(type(e), e.names) for e in errors], [
+            (UnspecifiedArgumentError, ('bogus',)),
+            (MultipleSpecifiedArgumentError, ('n',)),
+            (FormatError, ('workers',)),
+            (MissingRequiredArgumentError, ('host',)),
+            (ConflictError, ('a', 'b'))])
+
+        errors = p.validate(['--host', 'h', '--m', '1', '--n', '0',
+            '--workers', '3', '--max'])
+        self.assertEqual([(type(e), e.names) for e in errors], [
+            (MissingValueError, ('max',)),
+            (ConditionError, ('m', 'n'))])
+
+        try:
+            p._process_command_line(['--a', '--b', '--host', 'h'])
+            self.fail()
+        except ConflictError as e:
+            self.assertEqual(e.names, ('a', 'b'))
+
+    def test_parse_async(self):
+        try:
+            import asyncio
+            namespace = {'asyncio': asyncio}
+            # kept out of the module's syntax for Python 2
+            exec('''async def upper(value):
+    await asyncio.sleep(0.01)
+    if value == 'bad':
+        raise ValueError('bad value')
+    return value.upper()
+
+async def parse(parser, args):
+    return await parser.parse_async(args)
+''', namespace)
+        except (ImportError, SyntaxError):
+            return
+
+        p = Parser({})
+        p.str('a').cast(namespace['upper'])
+        p.str('b').cast(namespace['upper']).multiple()
+        p.int('n').requires(p['a'] == 'X')
+
+        def parse(*args):
+            loop = asyncio.new_event_loop()
+            try:
+                return loop.run_until_complete(namespace['parse'](p,
+                    list(args)))
+            finally:
+                loop.close()
+
+        vals = parse('--a', 'x', '--b', 'y', '--b', 'z', '--n', '3')
+        self.assertEqual(vals['a'], 'X')
+        self.assertEqual(vals['b'], ['Y', 'Z'])
+        self.assertEqual(vals['n'], 3)
+
+        self.assertEqual(parse()['a'], None)
+        self.assertRaises(FormatError, parse, '--a', 'bad')
+        self.assertRaises(ConditionError, parse, '--a', 'y', '--n', '3')
+        self.assertRaises(UnspecifiedArgumentError, parse, '--c')
+
+        p.out = StringIO()
+        self.assertEqual(parse('--help'), None)
+        self.assertTrue(p.out.getvalue().startswith('Usage'))
+
     def test_enum(self):
         def create():
             p = Parser()